@@ -0,0 +1,261 @@
+"""
+Materialized attendance analytics for Smart Attendance System.
+
+Aggregates (per-student/month, per-section/month, per-day and per-section/day
+present counts, plus attendance streaks) are built once from the master
+partitions with vectorized group-bys and then kept up to date incrementally
+from the register's change notifications, so dashboard queries are plain
+dictionary lookups instead of scans over the whole history.
+"""
+
+import os
+import threading
+import numpy as np
+import pandas as pd
+from settings import config
+
+SECTION_COLUMNS = ("Section", "Class")
+UNASSIGNED = "Unassigned"
+
+
+class AttendanceAnalytics:
+    def __init__(self, register):
+        self.register = register
+        self._lock = threading.RLock()
+        self._version = None
+        self._dirty = True
+        self._matrices = {}  # "YYYY-MM" -> monthly status matrix
+        self._matrix_epoch = 0  # Bumped whenever cached matrices are invalidated
+        register.writer.subscribe(self._on_change)
+
+    # ---------------- Build ----------------
+    def _load_sections(self):
+        """Optional section/class per student from the students import sheet."""
+        if not os.path.exists(config.students_file):
+            return {}
+        try:
+            df = pd.read_excel(config.students_file)
+        except Exception:
+            return {}
+        col = next((c for c in SECTION_COLUMNS if c in df.columns), None)
+        if col is None or "StudentID" not in df.columns:
+            return {}
+        df = df.dropna(subset=["StudentID"])
+        return dict(zip(df["StudentID"].tolist(), df[col].fillna(UNASSIGNED).astype(str).tolist()))
+
+    @staticmethod
+    def _counts(frame, keys):
+        """``{key: [present, days]}`` from a grouped present/total aggregation."""
+        if frame.empty:
+            return {}
+        agg = frame.groupby(keys, sort=False)["Present"].agg(["sum", "count"])
+        return {k: [int(p), int(n)] for k, p, n in zip(agg.index.tolist(), agg["sum"].tolist(), agg["count"].tolist())}
+
+    def rebuild(self):
+        """Recompute every aggregate from the register (one full scan)."""
+        # Read without the lock: a day rollover during the read publishes an event that ``_on_change``
+        # handles under it. A write that lands meanwhile leaves ``_version`` behind, forcing another rebuild.
+        version = self.register.writer.version()
+        register_df = self.register.load_daily()
+        today = self.register.today_str
+        master = self.register.load_master()
+        sections = self._load_sections()
+        with self._lock:
+            if not register_df.empty and {"StudentID", "Name"} <= set(register_df.columns):
+                register_df = register_df.dropna(subset=["StudentID"])
+                self.students = dict(zip(register_df["StudentID"].tolist(), register_df["Name"].astype(str).tolist()))
+            else:
+                self.students = {}
+            self.sections = {sid: sections.get(sid, UNASSIGNED) for sid in self.students}
+            self._section_totals = pd.Series(self.sections, dtype=object).value_counts().to_dict() if self.sections else {}
+
+            df = master.dropna(subset=["StudentID"]).copy()
+            df["Date"] = df["Date"].astype(str)
+            df["Present"] = df["Status"].astype(str).str.strip().str.upper().eq("P")
+            df["Month"] = df["Date"].str[:7]
+            df["Section"] = df["StudentID"].map(self.sections).fillna(UNASSIGNED)
+
+            self._student_month = self._counts(df, ["StudentID", "Month"])
+            self._section_month = self._counts(df, ["Section", "Month"])
+            self._daily = self._counts(df, "Date")
+            self._section_daily = self._counts(df, ["Section", "Date"])
+
+            # Streaks: run lengths of consecutive recorded days per student, computed column-wise
+            hist = df[df["Date"] < today].sort_values(["StudentID", "Date"])
+            present = hist["Present"]
+            new_run = (present != present.shift()) | (hist["StudentID"] != hist["StudentID"].shift())
+            run_len = hist.groupby(new_run.cumsum()).cumcount() + 1
+            last = hist.assign(RunLen=run_len).groupby("StudentID").tail(1)
+            self._streak_base = dict(zip(last["StudentID"].tolist(), (last["RunLen"] * last["Present"]).astype(int).tolist()))
+            longest = run_len[present].groupby(hist.loc[present, "StudentID"]).max()
+            self._longest_base = {k: int(v) for k, v in longest.items()}
+
+            todays = df[df["Date"] == today]
+            self.today = today
+            self._today_status = dict(zip(todays["StudentID"].tolist(), todays["Status"].astype(str).str.upper().tolist()))
+
+            self._matrices = {}
+            self._matrix_epoch += 1
+            self._version = version
+            self._dirty = False
+
+    def _ensure_fresh(self):
+        """Rebuild only if a change arrived that could not be applied incrementally."""
+        self.register.refresh_date()
+        with self._lock:
+            stale = self._dirty or self._version != self.register.writer.version() \
+                or self.today != self.register.today_str
+        if stale:
+            self.rebuild()
+
+    # ---------------- Incremental Updates ----------------
+    @staticmethod
+    def _bump(table, key, present_delta, days_delta):
+        counts = table.setdefault(key, [0, 0])
+        counts[0] += present_delta
+        counts[1] += days_delta
+
+    def _add_student(self, sid, name):
+        self.students[sid] = name
+        self.sections[sid] = UNASSIGNED
+        self._section_totals[UNASSIGNED] = self._section_totals.get(UNASSIGNED, 0) + 1
+
+    def _apply_mark(self, sid, name, status):
+        status = str(status).strip().upper()
+        prev = self._today_status.get(sid)
+        present_delta = int(status == "P") - int(prev == "P")
+        days_delta = 0 if prev is not None else 1
+        if sid not in self.students:
+            self._add_student(sid, name)
+        section = self.sections.get(sid, UNASSIGNED)
+        month = self.today[:7]
+        self._bump(self._student_month, (sid, month), present_delta, days_delta)
+        self._bump(self._section_month, (section, month), present_delta, days_delta)
+        self._bump(self._daily, self.today, present_delta, days_delta)
+        self._bump(self._section_daily, (section, self.today), present_delta, days_delta)
+        self._today_status[sid] = status
+
+    def _on_change(self, event):
+        with self._lock:
+            if self._dirty:
+                return
+            if event["type"] == "marks" and event["date"] == self.today:
+                self._matrices.pop(self.today[:7], None)
+                self._matrix_epoch += 1
+                names = event.get("names", {})
+                for sid, status in event["changes"].items():
+                    self._apply_mark(sid, names.get(sid, "Unknown"), status)
+            elif event["type"] == "students":
+                for sid, name in event["added"]:
+                    if sid not in self.students:
+                        self._add_student(sid, name)
+            elif event["type"] != "write":
+                self._dirty = True
+                return
+            # Every event of one commit carries that commit's version (e.g. "students" then "marks")
+            if self._version is not None and event.get("version") in (self._version, self._version + 1):
+                self._version = event["version"]
+            else:
+                # A write from another process slipped in between; fall back to a rebuild
+                self._dirty = True
+
+    # ---------------- Queries ----------------
+    @staticmethod
+    def _rate(counts):
+        present, days = counts if counts else (0, 0)
+        return {"present": present, "days": days, "percentage": round(present / days * 100, 2) if days else 0.0}
+
+    def student_month(self, student_id, month):
+        """Present days / recorded days for one student in ``YYYY-MM``."""
+        self._ensure_fresh()
+        with self._lock:
+            return self._rate(self._student_month.get((student_id, month)))
+
+    def section_month(self, section, month):
+        self._ensure_fresh()
+        with self._lock:
+            return self._rate(self._section_month.get((section, month)))
+
+    def day(self, date_str=None):
+        """Class-wide rate for one date (defaults to today)."""
+        self._ensure_fresh()
+        with self._lock:
+            return self._rate(self._daily.get(date_str or self.today))
+
+    def streaks(self, student_id):
+        """Current and longest run of consecutive recorded present days."""
+        self._ensure_fresh()
+        with self._lock:
+            return self._streaks(student_id)
+
+    def _streaks(self, student_id):
+        status = self._today_status.get(student_id)
+        base = self._streak_base.get(student_id, 0)
+        current = base + 1 if status == "P" else (0 if status is not None else base)
+        return {"current": current, "longest": max(self._longest_base.get(student_id, 0), current)}
+
+    # The writer thread updates the aggregates in ``_on_change``; queries read them under the same lock
+    def student(self, student_id):
+        """Everything the dashboard shows for one student."""
+        self._ensure_fresh()
+        with self._lock:
+            months = {m: self._rate(c) for (sid, m), c in self._student_month.items() if sid == student_id}
+            return {"StudentID": student_id, "Name": self.students.get(student_id),
+                    "Section": self.sections.get(student_id, UNASSIGNED),
+                    "months": dict(sorted(months.items())), "streaks": self._streaks(student_id)}
+
+    def summary(self, date_str=None):
+        """Total students, present count and per-section breakdown for a date (default today)."""
+        self._ensure_fresh()
+        with self._lock:
+            date_str = date_str or self.today
+            total = len(self.students)
+            present = (self._daily.get(date_str) or [0, 0])[0]
+            per_section = {}
+            for section, count in self._section_totals.items():
+                section_present = (self._section_daily.get((section, date_str)) or [0, 0])[0]
+                per_section[section] = {"total": count, "present": section_present,
+                                        "percentage": round(section_present / count * 100, 2) if count else 0.0}
+        return {
+            "date": date_str,
+            "total_students": total,
+            "present": present,
+            "percentage": round(present / total * 100, 2) if total else 0.0,
+            "sections": per_section,
+        }
+
+    def month_matrix(self, year, month):
+        """Student x day status matrix for one month, one ``P``/``A``/``-`` character per day column.
+
+        Built with a single pivot and cached until a mark lands in that month.
+        """
+        self._ensure_fresh()
+        period = f"{int(year):04d}-{int(month):02d}"
+        with self._lock:
+            if period in self._matrices:
+                return self._matrices[period]
+            epoch = self._matrix_epoch
+        df = self.register.load_master(f"{period}-01", f"{period}-31")
+        df = df.dropna(subset=["StudentID"])
+        if df.empty:
+            matrix = {"month": period, "days": [], "students": []}
+        else:
+            df["Date"] = df["Date"].astype(str)
+            df["Mark"] = np.where(df["Status"].astype(str).str.strip().str.upper().eq("P"), "P", "A")
+            grid = df.pivot_table(index="StudentID", columns="Date", values="Mark", aggfunc="last")
+            grid = grid.reindex(sorted(grid.columns), axis=1).fillna("-")
+            # Fixed-width U1 cells viewed as one U<days> string per row: no per-cell Python work
+            cells = np.ascontiguousarray(grid.to_numpy(dtype="U1"))
+            rows = cells.view(f"U{cells.shape[1]}").ravel()
+            names = df.groupby("StudentID")["Name"].last().reindex(grid.index).astype(str)
+            matrix = {
+                "month": period,
+                "days": [int(d[8:10]) for d in grid.columns],
+                "students": [{"StudentID": sid, "Name": name, "statuses": str(row)}
+                             for sid, name, row in zip(grid.index.tolist(), names.tolist(), rows.tolist())],
+            }
+        with self._lock:
+            # A mark (or rebuild) during the read may have made this matrix stale: return it, but do not cache it
+            if self._matrix_epoch == epoch:
+                self._matrices[period] = matrix
+        return matrix
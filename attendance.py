@@ -1,60 +1,262 @@
 import os
+import io
+import base64
 import pandas as pd
+from pathlib import Path
 from datetime import datetime, timedelta
 from calendar import month_name
-from crypto_utils import load_key, ensure_encrypted_backup, safe_decrypt_file, safe_temp_file
+from crypto_utils import load_keys, decrypt_to_buffer, schedule_encrypted_backup, backup_scheduler
 from settings import config
+from register_writer import get_writer, serialized_write
+from partitions import PartitionStore, MASTER_COLUMNS
+from metrics import metrics
 
 class AttendanceRegister:
     def __init__(self):
         self.excel_file = config.excel_file
         self.yearly_file = config.yearly_file
-        self.master_file = config.master_file
-        self.calendar_file = config.calendar_file
+        self.master_file = config.master_file  # legacy single-sheet master, migrated into partitions
         self.today = datetime.now().date()
         self.today_str = self.today.isoformat()
-        self.key = load_key()
-
+        self.partitions = PartitionStore(config.data_dir, self._read_table)
+        self.calendar_file = self.partitions.calendar_path(self.today.year)
+        self._catalog_version = None
+        backup_scheduler.coalesce_window = config.backup_coalesce_seconds
+        # All mutations of this data directory go through one writer (and one OS lock across processes)
+        self.writer = get_writer(config.data_dir)
+        self.writer.lock_timeout = config.writer_lock_timeout
+        self._snapshots = {}
+
+        self.ensure_registers()
+
+    @serialized_write
+    def ensure_registers(self):
+        """Create any missing register and add today's columns."""
+        self.partitions.migrate_legacy_master(config.master_file, self._write_table)
+        self.partitions.migrate_legacy_calendar(config.calendar_file)
+        self.partitions.compact_closed_years(self.today.year, on_compacted=schedule_encrypted_backup)
         self._ensure_register()
         self._ensure_yearly()
         self._ensure_master()
         self._ensure_calendar()
 
+    def refresh_date(self):
+        """Roll the register over to a new day (and year partition) after midnight.
+
+        Only a date comparison while the day is unchanged, so read paths call it too.
+        """
+        if datetime.now().date() == self.today:
+            return False
+        return self._roll_over()
+
+    @serialized_write
+    def _roll_over(self):
+        today = datetime.now().date()
+        if today == self.today:
+            return False
+        self.today = today
+        self.today_str = today.isoformat()
+        self.calendar_file = self.partitions.calendar_path(today.year)
+        self.ensure_registers()
+        self.writer.publish({"type": "rollover", "date": self.today_str})
+        return True
+
+    # ---------------- Today's Status ----------------
+    def statuses_today(self):
+        """``{StudentID: status}`` for today from a snapshot of the daily register."""
+        df = self.load_daily()
+        if df.empty or self.today_str not in df.columns:
+            return {}
+        return dict(zip(df["StudentID"].tolist(), df[self.today_str].astype(str).str.strip().str.upper()))
+
+    def status_today(self, student_id):
+        return self.statuses_today().get(student_id)
+
+    def marked_today(self):
+        """IDs already marked present today."""
+        return {sid for sid, status in self.statuses_today().items() if status == "P"}
+
+    # ---------------- Storage Helpers ----------------
+    def _read_table(self, path):
+        """Parse a register straight from memory, decrypting it if needed."""
+        return pd.read_excel(decrypt_to_buffer(path, load_keys(), strict=False))
+
+    @staticmethod
+    def _serialize(df):
+        buf = io.BytesIO()
+        df.to_excel(buf, index=False)
+        return buf.getvalue()
+
+    @staticmethod
+    def _replace_bytes(path, data):
+        """Write via a temp file and rename so readers never see a half-written workbook."""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        Path(tmp).write_bytes(data)
+        os.replace(tmp, path)
+        metrics.inc("register_bytes_written_total", len(data))
+
+    def _write_bytes(self, path, data):
+        """Write serialized register bytes once; the encrypted backup runs in the background."""
+        self._replace_bytes(path, data)
+        schedule_encrypted_backup(path, data=data)
+
+    def _write_table(self, df, path):
+        self._write_bytes(path, self._serialize(df))
+
+    def _ensure_backup(self, path):
+        """Back up an unchanged register only if no backup exists yet."""
+        if not os.path.exists(f"{path}.enc"):
+            schedule_encrypted_backup(path)
+
+    # ---------------- Snapshot Reads ----------------
+    def read_snapshot(self, path):
+        """Consistent copy of a register, re-read only when another write has landed."""
+        with self.writer.snapshot():
+            version = self.writer.version()
+            cached = self._snapshots.get(path)
+            if cached is None or cached[0] != version:
+                df = self._read_table(path) if os.path.exists(path) else pd.DataFrame()
+                cached = (version, df)
+                self._snapshots[path] = cached
+        return cached[1].copy()
+
+    def load_daily(self):
+        self.refresh_date()
+        return self.read_snapshot(self.excel_file)
+
+    def _sync_catalog(self):
+        """Pick up partitions another process created; call under ``writer.snapshot()``."""
+        version = self.writer.version()
+        if version != self._catalog_version:
+            self.partitions.reload_catalog()
+            self._catalog_version = version
+
+    def load_master(self, start=None, end=None):
+        """Master rows between ``start`` and ``end`` (ISO dates), read only from the partitions in range."""
+        self.refresh_date()
+        with self.writer.snapshot():
+            self._sync_catalog()
+            return self.partitions.query_master(start, end)
+
+    @staticmethod
+    def _student_id(value):
+        """StudentIDs are integers in the register; pandas may hand them back as floats."""
+        value = float(value)
+        return int(value) if value.is_integer() else value
+
+    @staticmethod
+    def encode_cursor(date_str, student_id):
+        return base64.urlsafe_b64encode(f"{date_str}|{student_id}".encode()).decode()
+
+    @classmethod
+    def decode_cursor(cls, cursor):
+        date_str, student_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return date_str, cls._student_id(student_id)
+
+    @staticmethod
+    def _select_master(df, start, end, student_id):
+        """Rows in ``start``..``end`` with a numeric StudentID (``== student_id`` if given), keyed by ``_id``."""
+        dates = df["Date"].astype(str)
+        ids = pd.to_numeric(df["StudentID"], errors="coerce")
+        mask = ids.notna()
+        if start:
+            mask &= dates >= str(start)
+        if end:
+            mask &= dates <= str(end)
+        if student_id is not None:
+            mask &= ids == student_id
+        return df[mask].assign(Date=dates[mask], _id=ids[mask])
+
+    def page_master(self, start=None, end=None, student_id=None, cursor=None, limit=None):
+        """Master rows matching the filters; returns ``(df, next_cursor)``. Read-only.
+
+        Without ``limit`` every matching row is returned, ordered by (Date, StudentID).
+        With it, pages run from the newest day backwards (StudentID ascending within
+        a day): month partitions are read newest first and reading stops as soon as
+        the page is full, so a page costs the same however much history there is.
+        The cursor is the last (Date, StudentID) key already returned.
+        """
+        self.refresh_date()
+        after_date = after_id = None
+        if cursor:
+            after_date, after_id = self.decode_cursor(cursor)
+            end = min(end, after_date) if end else after_date
+        if limit is None:
+            df = self._select_master(self.load_master(start, end), start, end, student_id)
+            df = df.sort_values(["Date", "_id"], kind="stable")
+        else:
+            frames, rows = [], 0
+            with self.writer.snapshot():
+                self._sync_catalog()
+                for period in self.partitions.master_periods(start, end):
+                    part = self._select_master(self.partitions.read_master_partition(period), start, end, student_id)
+                    if cursor:
+                        part = part[(part["Date"] < after_date) | ((part["Date"] == after_date) & (part["_id"] > after_id))]
+                    frames.append(part)
+                    rows += len(part)
+                    if rows > limit:
+                        break
+            if not rows:
+                return pd.DataFrame(columns=MASTER_COLUMNS), None
+            df = pd.concat(frames).sort_values(["Date", "_id"], ascending=[False, True], kind="stable")
+        next_cursor = None
+        if limit is not None and len(df) > limit:
+            df = df.iloc[:limit]
+            last = df.iloc[-1]
+            next_cursor = self.encode_cursor(last["Date"], self._student_id(last["_id"]))
+        return df.drop(columns="_id").reset_index(drop=True), next_cursor
+
+    # ---------------- Partition Writes ----------------
+    def _write_master(self, df, date_str=None):
+        period = self.partitions.period_of(date_str or self.today_str)
+        if self.partitions.is_read_only("master", period):
+            raise ValueError(f"Master partition {period} is compacted and read-only")
+        path = self.partitions.master_path(period)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._write_table(df, path)
+        self.partitions.record("master", period, path, len(df))
+
+    def _write_calendar(self, df):
+        os.makedirs(os.path.dirname(self.calendar_file), exist_ok=True)
+        self._write_table(df, self.calendar_file)
+        self.partitions.record("calendar", str(self.today.year), self.calendar_file, len(df))
+
     # ---------------- Daily Register ----------------
     def _ensure_register(self):
+        """Make sure the daily register exists with today's column; returns it."""
         if not os.path.exists(self.excel_file):
             df = pd.DataFrame(columns=["StudentID", "Name", self.today_str])
-            df.to_excel(self.excel_file, index=False)
+            self._write_table(df, self.excel_file)
+            return df
+        df = self._read_table(self.excel_file)
+        if self.today_str not in df.columns:
+            df[self.today_str] = 'A'
+            self._write_table(df, self.excel_file)
         else:
-            tmp_path = safe_temp_file()
-            try:
-                safe_decrypt_file(self.excel_file, self.key, dst_path=tmp_path)
-                df = pd.read_excel(tmp_path)
-                if self.today_str not in df.columns:
-                    df[self.today_str] = 'A'
-                    df.to_excel(self.excel_file, index=False)
-            finally:
-                if os.path.exists(tmp_path):
-                    os.remove(tmp_path)
-        ensure_encrypted_backup(self.excel_file, self.key)
+            self._ensure_backup(self.excel_file)
+        return df
 
     # ---------------- Yearly Register ----------------
     def _ensure_yearly(self):
         if not os.path.exists(self.yearly_file):
             months = [m[:3] for m in month_name if m]
             df = pd.DataFrame(columns=["StudentID", "Name", "JoinDate"] + months + ["Total%", "Total_Present", "Total_Absent"])
-            df.to_excel(self.yearly_file, index=False)
-        ensure_encrypted_backup(self.yearly_file, self.key)
+            self._write_table(df, self.yearly_file)
+        else:
+            self._ensure_backup(self.yearly_file)
 
     # ---------------- Master Register ----------------
     def _ensure_master(self):
-        if not os.path.exists(self.master_file):
-            df = pd.DataFrame(columns=["StudentID", "Name", "Date", "Status"])
-            df.to_excel(self.master_file, index=False)
-        ensure_encrypted_backup(self.master_file, self.key)
+        """Make sure this month's master partition exists."""
+        path = self.partitions.master_path(self.partitions.period_of(self.today_str))
+        if not os.path.exists(path):
+            self._write_master(pd.DataFrame(columns=MASTER_COLUMNS))
+        else:
+            self._ensure_backup(path)
 
     # ---------------- Calendar Register ----------------
     def _ensure_calendar(self):
+        """Make sure the calendar has every date of the current year; returns it."""
         year = self.today.year
         start = datetime(year, 1, 1)
         end = datetime(year, 12, 31)
@@ -62,89 +264,138 @@ class AttendanceRegister:
         expected_cols = ["StudentID", "Name"] + dates
 
         if not os.path.exists(self.calendar_file):
-            df = pd.DataFrame(columns=expected_cols)
-            df.to_excel(self.calendar_file, index=False)
+            # A new year's partition starts with every student on the daily register
+            daily = self._read_table(self.excel_file) if os.path.exists(self.excel_file) else pd.DataFrame()
+            df = pd.DataFrame('A', index=range(len(daily)), columns=expected_cols)
+            if not daily.empty:
+                df["StudentID"] = daily["StudentID"].values
+                df["Name"] = daily["Name"].values
+            self._write_calendar(df)
+            return df
+
+        df = self._read_table(self.calendar_file)
+        original_shape = df.shape
+
+        # Add missing date columns
+        missing_cols = [c for c in expected_cols if c not in df.columns]
+        if missing_cols:
+            df_new_cols = pd.DataFrame('A', index=df.index, columns=missing_cols)
+            df = pd.concat([df, df_new_cols], axis=1)
+
+        # Reorder columns
+        reordered = list(df.columns) != expected_cols
+        df = df[expected_cols]
+
+        # Remove duplicates
+        df = df.drop_duplicates(subset=["StudentID", "Name"], keep="first")
+
+        if missing_cols or reordered or df.shape != original_shape:
+            self._write_calendar(df)
         else:
-            tmp_path = safe_temp_file()
-            try:
-                safe_decrypt_file(self.calendar_file, self.key, dst_path=tmp_path)
-                df = pd.read_excel(tmp_path)
-
-                # Add missing date columns
-                missing_cols = [c for c in expected_cols if c not in df.columns]
-                if missing_cols:
-                    df_new_cols = pd.DataFrame('A', index=df.index, columns=missing_cols)
-                    df = pd.concat([df, df_new_cols], axis=1)
-
-                # Reorder columns
-                df = df[expected_cols]
-
-                # Remove duplicates
-                df = df.drop_duplicates(subset=["StudentID", "Name"], keep="first")
-
-                df.to_excel(self.calendar_file, index=False)
-            finally:
-                if os.path.exists(tmp_path):
-                    os.remove(tmp_path)
-
-        ensure_encrypted_backup(self.calendar_file, self.key)
+            self._ensure_backup(self.calendar_file)
+        return df
 
     # ---------------- Normalize Schemas ----------------
+    @serialized_write
     def _normalize_schemas(self):
-        """Ensure master file has correct columns."""
-        master_cols = ["StudentID", "Name", "Date", "Status"]
-        if os.path.exists(self.master_file):
+        """Ensure this month's master partition has correct columns."""
+        master_cols = MASTER_COLUMNS
+        period = self.partitions.period_of(self.today_str)
+        if os.path.exists(self.partitions.master_path(period)):
             try:
-                dfm = pd.read_excel(self.master_file)
+                dfm = self.partitions.read_master_partition(period)
                 for col in master_cols:
                     if col not in dfm.columns:
                         dfm[col] = ''
                 dfm = dfm[master_cols]
-                dfm.to_excel(self.master_file, index=False)
+                self._write_master(dfm)
             except Exception:
-                pd.DataFrame(columns=master_cols).to_excel(self.master_file, index=False)
+                self._write_master(pd.DataFrame(columns=master_cols))
 
     # ---------------- Add Student ----------------
     def add_student(self, student_id, name):
-        self._ensure_register()
-        df = pd.read_excel(self.excel_file)
-        if student_id not in df["StudentID"].values:
-            cols = list(df.columns)
-            row = {c: 'A' for c in cols}
-            row["StudentID"] = student_id
-            row["Name"] = name
-            df = pd.concat([df, pd.DataFrame([row], columns=cols)], ignore_index=True)
-            df.to_excel(self.excel_file, index=False)
-            ensure_encrypted_backup(self.excel_file, self.key)
+        self.add_students_bulk([(student_id, name)])
+
+    # ---------------- Bulk Add Students ----------------
+    @serialized_write
+    def add_students_bulk(self, records):
+        """Add many students at once; each register is read and written only once.
+
+        ``records`` is an iterable of ``(student_id, name)`` pairs or dicts with
+        ``StudentID``/``Name`` keys. Returns ``{"added": [...], "skipped": [...]}``
+        where ``added`` lists the IDs that were new to the daily register.
+        """
+        pairs, seen, skipped = [], set(), []
+        for rec in records:
+            if isinstance(rec, dict):
+                sid, name = rec.get("StudentID"), rec.get("Name")
+            else:
+                sid, name = rec
+            if sid in seen:
+                skipped.append(sid)
+                continue
+            seen.add(sid)
+            pairs.append((sid, name))
+        if not pairs:
+            return {"added": [], "skipped": skipped}
+
+        self.refresh_date()
+        df = self._ensure_register()
+        df, added = self._append_new_students(df, pairs, default='A')
+        if added:
+            self._write_table(df, self.excel_file)
 
         self._ensure_yearly()
-        yf = pd.read_excel(self.yearly_file)
-        if student_id not in yf.get("StudentID", pd.Series(dtype=object)).values:
-            months = [m[:3] for m in month_name if m]
-            row = {"StudentID": student_id, "Name": name, "JoinDate": self.today_str}
-            for m in months:
-                row[m] = 0.0
-            row["Total%"] = 0.0
-            row["Total_Present"] = 0
-            row["Total_Absent"] = 0
-            yf = pd.concat([yf, pd.DataFrame([row])], ignore_index=True)
-            yf.to_excel(self.yearly_file, index=False)
-            ensure_encrypted_backup(self.yearly_file, self.key)
-
-        self._ensure_calendar()
-        cf = pd.read_excel(self.calendar_file)
-        if student_id not in cf["StudentID"].values:
-            new_row = {"StudentID": student_id, "Name": name}
-            for c in cf.columns:
-                if c not in ["StudentID", "Name"]:
-                    new_row[c] = 'A'
-            cf = pd.concat([cf, pd.DataFrame([new_row], columns=cf.columns)], ignore_index=True)
-            cf.to_excel(self.calendar_file, index=False)
-            ensure_encrypted_backup(self.calendar_file, self.key)
+        yf = self._read_table(self.yearly_file)
+        months = [m[:3] for m in month_name if m]
+        yearly_defaults = {m: 0.0 for m in months}
+        yearly_defaults.update({"JoinDate": self.today_str, "Total%": 0.0, "Total_Present": 0, "Total_Absent": 0})
+        yf, yearly_added = self._append_new_students(yf, pairs, defaults=yearly_defaults)
+        if yearly_added:
+            self._write_table(yf, self.yearly_file)
+
+        cf = self._ensure_calendar()
+        cf, calendar_added = self._append_new_students(cf, pairs, default='A')
+        if calendar_added:
+            self._write_calendar(cf)
+
+        added_ids = set(added)
+        skipped.extend(sid for sid, _ in pairs if sid not in added_ids)
+        if added:
+            self.writer.publish({"type": "students", "added": [(sid, name) for sid, name in pairs if sid in added_ids]})
+        return {"added": added, "skipped": skipped}
+
+    @staticmethod
+    def _append_new_students(df, pairs, default=None, defaults=None):
+        """Append rows for IDs not yet in ``df`` in a single concat."""
+        for col in ["StudentID", "Name"]:
+            if col not in df.columns:
+                df[col] = pd.Series(dtype=object)
+        existing = set(df["StudentID"].values)
+        new = [(sid, name) for sid, name in pairs if sid not in existing]
+        if not new:
+            return df, []
+        ids, names = zip(*new)
+        block = pd.DataFrame(default, index=range(len(new)), columns=df.columns)
+        for col, value in (defaults or {}).items():
+            block[col] = value
+        block["StudentID"] = list(ids)
+        block["Name"] = list(names)
+        df = block if df.empty else pd.concat([df, block], ignore_index=True)
+        return df, list(ids)
 
     # ---------------- Mark Attendance ----------------
+    @serialized_write
     def mark_attendance(self, student_id, name, status="P"):
-        """Mark attendance for a student and update all Excel files."""
+        """Mark attendance for a student and update all Excel files.
+
+        Returns False without writing anything if the student already has
+        ``status`` for today.
+        """
+        self.refresh_date()
+        if self.status_today(student_id) == status:
+            print(f"[DEBUG] {name} (ID: {student_id}) already marked {status} today, nothing to write")
+            return False
         try:
             print(f"[DEBUG] Marking attendance for {name} (ID: {student_id}) - Status: {status}")
             print(f"[DEBUG] Excel file path: {self.excel_file}")
@@ -158,7 +409,7 @@ class AttendanceRegister:
                 print(f"[DEBUG] Creating new Excel file: {self.excel_file}")
                 df = pd.DataFrame(columns=["StudentID", "Name", self.today_str])
             else:
-                df = pd.read_excel(self.excel_file)
+                df = self._read_table(self.excel_file)
                 print(f"[DEBUG] Loaded Excel with {len(df)} rows")
             
             if self.today_str not in df.columns:
@@ -180,16 +431,19 @@ class AttendanceRegister:
                 print(f"[DEBUG] Added new student {student_id}")
             
             # Save daily register
-            df.to_excel(self.excel_file, index=False)
+            self._write_table(df, self.excel_file)
             print(f"[DEBUG] Saved Excel file: {self.excel_file}")
-            ensure_encrypted_backup(self.excel_file, self.key)
 
             # Update other registers
             self._update_master(student_id, name, status)
             self._update_calendar(student_id, status)
-            self._update_yearly(student_id)
+            self._update_yearly(student_id, daily_df=df)
             
             print(f"[SUCCESS] Attendance marked successfully for {name}")
+            metrics.inc("marks_written_total")
+            self.writer.publish({"type": "marks", "date": self.today_str,
+                                 "changes": {student_id: status}, "names": {student_id: name}})
+            return True
             
         except Exception as e:
             print(f"[ERROR] Error marking attendance: {e}")
@@ -198,112 +452,239 @@ class AttendanceRegister:
             # Try to save at least the daily register
             try:
                 if os.path.exists(self.excel_file):
-                    df = pd.read_excel(self.excel_file)
+                    df = self._read_table(self.excel_file)
                     if self.today_str not in df.columns:
                         df[self.today_str] = 'A'
                     student_mask = df["StudentID"] == student_id
                     if student_mask.any():
                         df.loc[student_mask, self.today_str] = status
-                        df.to_excel(self.excel_file, index=False)
+                        self._write_table(df, self.excel_file)
                         print(f"[FALLBACK] Saved basic attendance for {name}")
             except Exception as fallback_error:
                 print(f"[FALLBACK ERROR] {fallback_error}")
+            return False
 
     # ---------------- Master Update ----------------
     def _update_master(self, student_id, name, status):
-        tmp_path = safe_temp_file()
-        try:
-            safe_decrypt_file(self.master_file, self.key, dst_path=tmp_path)
-            df = pd.read_excel(tmp_path)
+        # Only this month's partition is read and rewritten
+        df = self.partitions.read_master_partition(self.partitions.period_of(self.today_str))
 
-            mask = (df['StudentID'] == student_id) & (df['Date'] == self.today_str)
-            if mask.any():
-                df.loc[mask, 'Status'] = status
-            else:
-                new_row = {"StudentID": student_id, "Name": name, "Date": self.today_str, "Status": status}
-                df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
+        mask = (df['StudentID'] == student_id) & (df['Date'] == self.today_str)
+        if mask.any():
+            df.loc[mask, 'Status'] = status
+        else:
+            new_row = {"StudentID": student_id, "Name": name, "Date": self.today_str, "Status": status}
+            df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
 
-            df.to_excel(self.master_file, index=False)
-            ensure_encrypted_backup(self.master_file, self.key)
-        finally:
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
+        self._write_master(df)
 
     # ---------------- Calendar Update ----------------
     def _update_calendar(self, student_id, status):
-        tmp_path = safe_temp_file()
-        try:
-            safe_decrypt_file(self.calendar_file, self.key, dst_path=tmp_path)
-            df = pd.read_excel(tmp_path)
+        df = self._read_table(self.calendar_file)
 
-            if self.today_str not in df.columns:
-                df[self.today_str] = 'A'
-            df.loc[df["StudentID"] == student_id, self.today_str] = status
+        if self.today_str not in df.columns:
+            df[self.today_str] = 'A'
+        df.loc[df["StudentID"] == student_id, self.today_str] = status
 
-            df.to_excel(self.calendar_file, index=False)
-            ensure_encrypted_backup(self.calendar_file, self.key)
-        finally:
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
+        self._write_calendar(df)
 
     # ---------------- Yearly Update ----------------
-    def _update_yearly(self, student_id):
-        tmp_daily = safe_temp_file()
-        tmp_yearly = safe_temp_file()
-        try:
-            # Read daily and yearly files safely
-            safe_decrypt_file(self.excel_file, self.key, dst_path=tmp_daily)
-            daily_df = pd.read_excel(tmp_daily)
-
-            safe_decrypt_file(self.yearly_file, self.key, dst_path=tmp_yearly)
-            yf = pd.read_excel(tmp_yearly)
-
-            months = [m[:3] for m in month_name if m]
-            idx_list = yf.index[yf["StudentID"] == student_id].tolist()
-            if not idx_list:
-                return
-            idx = idx_list[0]
-
-            join_date = yf.loc[idx, "JoinDate"]
-            join_date = datetime.fromisoformat(str(join_date)).date() if pd.notna(join_date) else None
-
-            month_totals = {m: 0 for m in months}
-            month_present = {m: 0 for m in months}
-
-            for col in daily_df.columns[2:]:
+    def _update_yearly(self, student_id, daily_df=None):
+        if daily_df is None:
+            daily_df = self._read_table(self.excel_file)
+        yf = self._read_table(self.yearly_file)
+
+        if not (yf["StudentID"] == student_id).any():
+            return
+        yf = self._recompute_yearly(daily_df, yf, [student_id])
+
+        self._write_table(yf, self.yearly_file)
+
+    @staticmethod
+    def _recompute_yearly(daily_df, yf, student_ids):
+        """Recompute monthly/total percentages for ``student_ids`` from the daily register.
+
+        Works on the whole date block at once instead of looping column by column.
+        """
+        months = [m[:3] for m in month_name if m]
+        date_cols, col_dates = [], []
+        for col in daily_df.columns[2:]:
+            try:
+                col_dates.append(datetime.fromisoformat(str(col)).date())
+                date_cols.append(col)
+            except Exception:
+                continue
+
+        rows = yf.index[yf["StudentID"].isin(student_ids)]
+        if len(rows) == 0:
+            return yf
+        daily = daily_df.drop_duplicates(subset=["StudentID"]).set_index("StudentID")
+        ids = yf.loc[rows, "StudentID"]
+        ids = ids[ids.isin(daily.index)]
+        rows = ids.index
+        if len(rows) == 0:
+            return yf
+
+        statuses = daily.loc[ids.values, date_cols].astype(str)
+        present = statuses.apply(lambda c: c.str.strip().str.upper() == "P").to_numpy()
+
+        joined = pd.to_datetime(yf.loc[rows, "JoinDate"].astype(str), errors="coerce").to_numpy()
+        dates = pd.to_datetime(pd.Series(col_dates)).to_numpy()
+        counted = pd.isna(joined)[:, None] | (dates[None, :] >= joined[:, None])
+        month_of_col = [d.strftime("%b") for d in col_dates]
+
+        def pct(present_counts, day_counts):
+            return [round(p / d * 100, 2) if d > 0 else 0.0 for p, d in zip(present_counts, day_counts)]
+
+        total_present = 0
+        total_days = 0
+        for m in months:
+            in_month = [i for i, mo in enumerate(month_of_col) if mo == m]
+            m_days = counted[:, in_month].sum(axis=1)
+            m_present = (counted[:, in_month] & present[:, in_month]).sum(axis=1)
+            yf[m] = yf[m].astype(float)
+            yf.loc[rows, m] = pct(m_present, m_days)
+            total_present = total_present + m_present
+            total_days = total_days + m_days
+
+        yf["Total%"] = yf["Total%"].astype(float)
+        yf.loc[rows, "Total%"] = pct(total_present, total_days)
+        yf.loc[rows, "Total_Present"] = total_present
+        yf.loc[rows, "Total_Absent"] = total_days - total_present
+        return yf
+
+    # ---------------- Bulk Mark Attendance ----------------
+    @serialized_write
+    def mark_attendance_bulk(self, records):
+        """Apply many statuses for today in one read-modify-write pass per register.
+
+        ``records`` is an iterable of ``(student_id, name, status)`` tuples or dicts
+        with ``StudentID``/``Name``/``Status`` keys. The update is all-or-nothing:
+        if any record is invalid nothing is written, and if writing fails every
+        register is restored. Returns ``{"success", "results"}`` with one result
+        per input record.
+        """
+        results, statuses, names = [], {}, {}
+        for rec in records:
+            if isinstance(rec, dict):
+                sid, name, status = rec.get("StudentID"), rec.get("Name", "Unknown"), rec.get("Status", "P")
+            elif isinstance(rec, (list, tuple)) and len(rec) == 3:
+                sid, name, status = rec
+            else:
+                results.append({"record": rec, "Status": None, "error": "malformed record"})
+                continue
+            result = {"StudentID": sid, "Name": name}
+            status = str(status).strip().upper()
+            if sid is None or (isinstance(sid, float) and pd.isna(sid)):
+                result["error"] = "missing StudentID"
+            else:
                 try:
-                    col_date = datetime.fromisoformat(col).date()
-                except Exception:
-                    continue
-                if join_date and col_date < join_date:
-                    continue
-                month_abbr = col_date.strftime("%b")
-                val = str(daily_df.loc[daily_df["StudentID"] == student_id, col].values[0]).strip().upper()
-                month_totals[month_abbr] += 1
-                if val == "P":
-                    month_present[month_abbr] += 1
-
-            total_present = sum(month_present.values())
-            total_days = sum(month_totals.values())
-
-            for m in months:
-                yf.loc[idx, m] = round((month_present[m] / month_totals[m]) * 100, 2) if month_totals[m] > 0 else 0.0
-            yf.loc[idx, "Total%"] = round((total_present / total_days) * 100, 2) if total_days > 0 else 0.0
-            yf.loc[idx, "Total_Present"] = total_present
-            yf.loc[idx, "Total_Absent"] = total_days - total_present
-
-            yf.to_excel(self.yearly_file, index=False)
-            ensure_encrypted_backup(self.yearly_file, self.key)
-        finally:
-            for tmp_file in [tmp_daily, tmp_yearly]:
-                if os.path.exists(tmp_file):
-                    os.remove(tmp_file)
+                    sid = self._student_id(sid)  # JSON clients may send "12" or 12.0
+                except (TypeError, ValueError):
+                    pass
+                if not isinstance(sid, int) or isinstance(sid, bool):
+                    result["error"] = f"invalid StudentID {result['StudentID']!r}"
+                elif status not in ("P", "A"):
+                    result["error"] = f"invalid status {status!r}"
+                else:
+                    result["StudentID"] = sid
+            result["Status"] = status
+            results.append(result)
+            if "error" not in result:
+                statuses[sid] = status
+                names.setdefault(sid, name)
+
+        if any("error" in r for r in results):
+            for r in results:
+                r["applied"] = False
+            return {"success": False, "results": results}
+        if not statuses:
+            return {"success": True, "results": results}
+
+        self.refresh_date()
+        daily = self._ensure_register()
+        self._ensure_yearly()
+        self._ensure_master()
+        cal = self._ensure_calendar()
+        pairs = list(names.items())
+        today = self.today_str
+
+        # Daily register
+        daily, _ = self._append_new_students(daily, pairs, default='A')
+        if today not in daily.columns:
+            daily[today] = 'A'
+        previous = dict(zip(daily["StudentID"], daily[today].astype(str)))
+        daily[today] = daily["StudentID"].map(statuses).fillna(daily[today])
+
+        # Master register
+        master_period = self.partitions.period_of(today)
+        if self.partitions.is_read_only("master", master_period):
+            raise ValueError(f"Master partition {master_period} is compacted and read-only")
+        master_path = self.partitions.master_path(master_period)
+        master = self.partitions.read_master_partition(master_period)
+        today_mask = master["Date"].astype(str) == today
+        hit = today_mask & master["StudentID"].isin(statuses.keys())
+        master.loc[hit, "Status"] = master.loc[hit, "StudentID"].map(statuses)
+        have_row = set(master.loc[hit, "StudentID"].values)
+        missing = [sid for sid in statuses if sid not in have_row]
+        if missing:
+            rows = pd.DataFrame({"StudentID": missing,
+                                 "Name": [names[sid] for sid in missing],
+                                 "Date": today,
+                                 "Status": [statuses[sid] for sid in missing]})
+            master = rows if master.empty else pd.concat([master, rows], ignore_index=True)
+
+        # Calendar register
+        cal, _ = self._append_new_students(cal, pairs, default='A')
+        if today not in cal.columns:
+            cal[today] = 'A'
+        cal[today] = cal["StudentID"].map(statuses).fillna(cal[today])
+
+        # Yearly register
+        yf = self._read_table(self.yearly_file)
+        months = [m[:3] for m in month_name if m]
+        yearly_defaults = {m: 0.0 for m in months}
+        yearly_defaults.update({"JoinDate": today, "Total%": 0.0, "Total_Present": 0, "Total_Absent": 0})
+        yf, _ = self._append_new_students(yf, pairs, defaults=yearly_defaults)
+        yf = self._recompute_yearly(daily, yf, list(statuses))
+
+        # Serialize everything before touching disk so a bad frame cannot leave a partial update
+        os.makedirs(os.path.dirname(master_path), exist_ok=True)
+        outputs = [(self.excel_file, self._serialize(daily)), (master_path, self._serialize(master)),
+                   (self.calendar_file, self._serialize(cal)), (self.yearly_file, self._serialize(yf))]
+        snapshot = {path: Path(path).read_bytes() if os.path.exists(path) else None for path, _ in outputs}
+        try:
+            for path, data in outputs:
+                self._replace_bytes(path, data)
+        except Exception:
+            for path, data in snapshot.items():
+                if data is None:
+                    if os.path.exists(path):
+                        os.remove(path)
+                else:
+                    self._replace_bytes(path, data)
+            raise
+        for path, data in outputs:
+            schedule_encrypted_backup(path, data=data)
+        self.partitions.record("master", master_period, master_path, len(master))
+        self.partitions.record("calendar", str(self.today.year), self.calendar_file, len(cal))
+
+        for r in results:
+            r["applied"] = True
+            r["changed"] = previous.get(r["StudentID"]) != r["Status"]
+        metrics.inc("marks_written_total", sum(1 for r in results if r["changed"]))
+        self.writer.publish({"type": "marks", "date": today, "changes": dict(statuses), "names": dict(names)})
+        return {"success": True, "results": results}
 
     # ---------------- Reset ----------------
+    @serialized_write
     def reset_all(self):
-        for f in [self.excel_file, self.yearly_file, self.master_file, self.calendar_file]:
+        for f in [self.excel_file, self.yearly_file, self.master_file, config.calendar_file]:
+            backup_scheduler.cancel(f)
             if os.path.exists(f):
                 os.remove(f)
+        self.partitions.reset()
+        self.writer.publish({"type": "reset"})
         self._ensure_register()
         self._ensure_yearly()
         self._ensure_master()
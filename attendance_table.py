@@ -0,0 +1,269 @@
+"""
+Attendance table for the desktop GUI.
+
+``AttendanceTableModel`` keeps an in-memory copy of the daily register and
+follows the register writer's change notifications. Marks and enrollments
+update single cells and rows, and the view redraws only the rows that
+changed. The register is read again only after a reset, a rollover, a silent
+write, or a write from another process (seen through the version counter).
+That re-read runs on a background thread and is then diffed into the model.
+
+``VirtualTable`` shows the model in a Treeview that only ever holds the
+visible rows and date columns. Scrolling refills those items instead of
+creating one item per student and one column per day.
+"""
+
+import queue
+import threading
+import tkinter as tk
+from tkinter import ttk
+from datetime import date
+import pandas as pd
+
+FIXED_COLUMNS = ["StudentID", "Name"]
+
+
+def today_column():
+    """Today's date column; the register's own date only advances when it is read or written."""
+    return date.today().isoformat()
+
+
+class AttendanceTableModel:
+    def __init__(self, register):
+        self.register = register
+        self.columns = list(FIXED_COLUMNS)
+        self.order = []  # StudentIDs in register order
+        self.rows = {}   # StudentID -> {column: value}
+        self.version = None
+        self._events = queue.Queue()
+        self._resyncing = False
+        register.writer.subscribe(self._events.put)  # Called on the writer thread; applied on the Tk thread
+
+    # ---------------- Snapshots ----------------
+    def _snapshot(self):
+        version = self.register.writer.version()
+        df = self.register.load_daily()
+        if "StudentID" not in df.columns or "Name" not in df.columns:
+            return version, list(FIXED_COLUMNS), [], {}
+        # Hide rows with NaN/blank StudentID or Name
+        df = df.dropna(subset=["StudentID", "Name"]).copy()
+        df["Name"] = df["Name"].astype(str).str.strip()
+        df = df[df["Name"] != ""]
+        df = df.astype(object).where(pd.notna(df), "")
+        columns = FIXED_COLUMNS + [str(c) for c in df.columns if c not in FIXED_COLUMNS]
+        df.columns = [str(c) for c in df.columns]
+        records = df[columns].to_dict("records")
+        order = [rec["StudentID"] for rec in records]
+        return version, columns, order, dict(zip(order, records))
+
+    def load(self):
+        """Read the register synchronously (at startup)."""
+        self._apply_snapshot(*self._snapshot())
+
+    def resync(self):
+        """Re-read the register on a background thread; the result is applied by ``drain``."""
+        if self._resyncing:
+            return
+        self._resyncing = True
+
+        def read():
+            try:
+                self._events.put({"type": "_snapshot", "snapshot": self._snapshot()})
+            except Exception as e:
+                print(f"[ERROR] Attendance table reload failed: {e}")
+                self._resyncing = False
+
+        threading.Thread(target=read, name="attendance-table-reload", daemon=True).start()
+
+    def _apply_snapshot(self, version, columns, order, rows):
+        """Swap in a fresh snapshot; returns ``(changed_ids, structure_changed)``."""
+        structure = columns != self.columns or order != self.order
+        changed = {sid for sid, row in rows.items() if self.rows.get(sid) != row}
+        self.columns, self.order, self.rows, self.version = columns, order, rows, version
+        return changed, structure
+
+    # ---------------- Change Notifications ----------------
+    def drain(self):
+        """Apply queued register events; returns ``(changed_ids, structure_changed)``. Tk thread only."""
+        changed, structure = set(), False
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                break
+            kind = event["type"]
+            if kind == "_snapshot":
+                self._resyncing = False
+                rows, moved = self._apply_snapshot(*event["snapshot"])
+                changed |= rows
+                structure |= moved
+                continue
+            if kind == "marks":
+                structure |= self._apply_marks(event, changed)
+            elif kind == "students":
+                structure |= self._add_rows(event["added"], changed)
+            else:
+                # reset, rollover or a silent write: the event does not say what changed
+                self.resync()
+            self.version = event.get("version", self.version)
+        if self._events.empty() and not self._resyncing and self.register.writer.version() != self.version:
+            self.resync()  # Another process wrote to the register
+        return changed, structure
+
+    def _apply_marks(self, event, changed):
+        date = event["date"]
+        structure = date not in self.columns
+        if structure:
+            self.columns.append(date)
+        names = event.get("names", {})
+        structure |= self._add_rows([(sid, names.get(sid, "")) for sid in event["changes"] if sid not in self.rows],
+                                    changed)
+        for sid, status in event["changes"].items():
+            self.rows[sid][date] = status
+            changed.add(sid)
+        return structure
+
+    def _add_rows(self, pairs, changed):
+        added = False
+        for sid, name in pairs:
+            if sid in self.rows:
+                continue
+            self.rows[sid] = {"StudentID": sid, "Name": name, **{c: "A" for c in self.columns[len(FIXED_COLUMNS):]}}
+            self.order.append(sid)
+            changed.add(sid)
+            added = True
+        return added
+
+    def value(self, sid, column):
+        return self.rows[sid].get(column, "A" if column == today_column() else "")
+
+
+class VirtualTable:
+    """Treeview over an ``AttendanceTableModel`` that materializes only the visible window.
+
+    In compact mode the columns are StudentID, Name and today. The full view
+    keeps StudentID and Name fixed and scrolls horizontally through the dates.
+    """
+
+    ROW_HEIGHT = 20
+    HEADER_HEIGHT = 25
+    DATE_WIDTH = 100
+
+    def __init__(self, parent, model, compact=True):
+        self.model = model
+        self.compact = compact
+        self.top = 0   # first visible row
+        self.left = 0  # first visible date column (full view)
+        self._columns = None
+        self._items = []   # Treeview items, one per visible row
+        self._window = {}  # StudentID -> item currently showing it
+
+        self.tree = ttk.Treeview(parent, show="headings")
+        self.vbar = ttk.Scrollbar(parent, orient="vertical", command=self._yview)
+        self.hbar = ttk.Scrollbar(parent, orient="horizontal", command=self._xview)
+        self.vbar.pack(side=tk.RIGHT, fill="y")
+        self.hbar.pack(side=tk.BOTTOM, fill="x")
+        self.tree.pack(side=tk.LEFT, fill="both", expand=True)
+        self.tree.bind("<Configure>", lambda e: self.render())
+        self.tree.bind("<MouseWheel>", lambda e: self._scroll_rows(-1 if e.delta > 0 else 1, 3))
+        self.tree.bind("<Button-4>", lambda e: self._scroll_rows(-1, 3))
+        self.tree.bind("<Button-5>", lambda e: self._scroll_rows(1, 3))
+        self.tree.bind("<Shift-MouseWheel>", lambda e: self._scroll_cols(-1 if e.delta > 0 else 1))
+
+    # ---------------- Window ----------------
+    def _visible_rows(self):
+        # Measure a drawn row when there is one; the row height depends on the theme and font
+        bbox = self.tree.bbox(self._items[0]) if self._items else None
+        header, row = (bbox[1], bbox[3]) if bbox else (self.HEADER_HEIGHT, self.ROW_HEIGHT)
+        return max(1, (self.tree.winfo_height() - header) // max(1, row))
+
+    def _visible_dates(self):
+        return max(1, (self.tree.winfo_width() - 250) // self.DATE_WIDTH)
+
+    def _date_columns(self):
+        if self.compact:
+            return [today_column()]
+        return self.model.columns[len(FIXED_COLUMNS):]
+
+    def _shown_columns(self):
+        dates = self._date_columns()
+        if self.compact:
+            return FIXED_COLUMNS + dates
+        self.left = max(0, min(self.left, len(dates) - self._visible_dates()))
+        return FIXED_COLUMNS + dates[self.left:self.left + self._visible_dates()]
+
+    def render(self):
+        """Refill every visible item, e.g. after scrolling, resizing or a structural change."""
+        order = self.model.order
+        rows = self._visible_rows()
+        self.top = max(0, min(self.top, len(order) - rows))
+        columns = self._shown_columns()
+        if columns != self._columns:
+            self._columns = columns
+            self.tree["columns"] = columns
+            for col in columns:
+                self.tree.heading(col, text=col)
+                self.tree.column(col, width=140 if col == "Name" else 110 if self.compact else self.DATE_WIDTH,
+                                 stretch=False)
+        count = min(rows, len(order) - self.top)
+        while len(self._items) < count:
+            self._items.append(self.tree.insert("", "end"))
+        while len(self._items) > count:
+            self.tree.delete(self._items.pop())
+        self._window = {}
+        for item, sid in zip(self._items, order[self.top:self.top + count]):
+            self._window[sid] = item
+            self.tree.item(item, values=[self.model.value(sid, c) for c in columns])
+        self._update_scrollbars(rows)
+
+    def update_rows(self, changed, structure=False):
+        """Show model changes; only rows in the visible window are touched."""
+        if self.compact and self._columns and self._columns[len(FIXED_COLUMNS):] != self._date_columns():
+            structure = True  # The day changed: the compact view moves to the new date's column
+        if structure:
+            self.render()
+            return
+        for sid in changed:
+            item = self._window.get(sid)
+            if item is not None:
+                self.tree.item(item, values=[self.model.value(sid, c) for c in self._columns])
+
+    def set_compact(self, compact):
+        self.compact = compact
+        self.render()
+
+    # ---------------- Scrolling ----------------
+    def _update_scrollbars(self, rows):
+        total = max(1, len(self.model.order))
+        self.vbar.set(self.top / total, min(1.0, (self.top + rows) / total))
+        dates = max(1, len(self._date_columns()))
+        shown = len(self._columns) - len(FIXED_COLUMNS)
+        first = 0 if self.compact else self.left
+        self.hbar.set(first / dates, min(1.0, (first + shown) / dates))
+
+    @staticmethod
+    def _target(args, position, total, page):
+        if args[0] == "moveto":
+            return int(float(args[1]) * total)
+        step = int(args[1])
+        return position + step * (page if args[2] == "pages" else 1)
+
+    def _yview(self, *args):
+        self.top = self._target(args, self.top, len(self.model.order), self._visible_rows())
+        self.render()
+
+    def _xview(self, *args):
+        if not self.compact:
+            self.left = self._target(args, self.left, len(self._date_columns()), self._visible_dates())
+            self.render()
+
+    def _scroll_rows(self, direction, amount):
+        self.top += direction * amount
+        self.render()
+        return "break"  # The Treeview's own wheel binding would scroll inside the window
+
+    def _scroll_cols(self, direction):
+        if not self.compact:
+            self.left += direction
+            self.render()
+        return "break"
@@ -1,10 +1,20 @@
-from cryptography.fernet import Fernet, InvalidToken
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from pathlib import Path
 import shutil
 import os
+import io
+import base64
+import hashlib
+import struct
 import tempfile
 import atexit
 import time
+import threading
+from datetime import datetime
 
 # ----------------- KEY MANAGEMENT -----------------
 KEY_PATH = Path("secret.key")
@@ -22,6 +32,24 @@ def load_key(path: str = "secret.key") -> bytes:
         return generate_key(path)
     return p.read_bytes()
 
+def load_keys(path: str = "secret.key") -> list:
+    """Load the primary key followed by any retired keys still needed for reading.
+
+    Retired keys live one per line in ``<path>.old`` while a key rotation is in progress.
+    """
+    keys = [load_key(path)]
+    old = Path(f"{path}.old")
+    if old.exists():
+        keys += [k.strip() for k in old.read_bytes().splitlines() if k.strip() and k.strip() not in keys]
+    return keys
+
+def _as_keys(key) -> list:
+    """Accept a single key or a keyring list; the first entry is used for encryption."""
+    return list(key) if isinstance(key, (list, tuple)) else [key]
+
+def _fernet(key):
+    return MultiFernet([Fernet(k) for k in _as_keys(key)])
+
 def delete_key(path: str = "secret.key") -> bool:
     """Delete the encryption key file if it exists."""
     p = Path(path)
@@ -30,43 +58,403 @@ def delete_key(path: str = "secret.key") -> bool:
         return True
     return False
 
+# ----------------- CHUNKED CONTAINER -----------------
+# Layout: header | sealed chunk 0 | ... | sealed chunk N-1 | sealed index | trailer
+#   header  = magic(6) key_id(8) chunk_size(u32) salt(32)
+#   chunk i = AES-GCM(plaintext_i), nonce = u32(0) + u64(i), aad = header + u64(i) + is_last
+#   index   = AES-GCM(N x (offset u64, plain_len u32)), nonce = u32(0) + u64(2**64 - 1)
+#   trailer = chunk_count(u64) index_len(u32) end_magic(6)
+# Every file is sealed under its own subkey, derived from the key and the
+# random salt, so the counter nonces never repeat under one AES key. Each
+# chunk is sealed on its own, so files stream with constant memory and any
+# chunk can be read without decrypting the rest. Version 1 files (a 4-byte
+# random nonce prefix under one shared key) are still read.
+CHUNK_MAGIC = b"SACHK2"
+CHUNK_MAGIC_V1 = b"SACHK1"
+CHUNK_END_MAGIC = b"SACIDX"
+DEFAULT_CHUNK_SIZE = 1 << 20
+_HEADER = struct.Struct(">6s8sI32s")
+_HEADER_V1 = struct.Struct(">6s8sI4s")
+_NONCE_PREFIX = bytes(4)
+_TRAILER = struct.Struct(">QI6s")
+_INDEX_ENTRY = struct.Struct(">QI")
+_TAG_SIZE = 16
+_INDEX_COUNTER = 2 ** 64 - 1
+
+def _container_key(key: bytes) -> bytes:
+    """Derive the version 1 container key (also the basis of key ids) from a Fernet key."""
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+                info=b"smart-attendance-chunked-v1").derive(base64.urlsafe_b64decode(key))
+
+def _file_key(key: bytes, salt: bytes) -> bytes:
+    """Derive the AES-256 subkey of one container from a Fernet key and the file's salt."""
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=salt,
+                info=b"smart-attendance-chunked-v2").derive(base64.urlsafe_b64decode(key))
+
+def key_id(key: bytes) -> bytes:
+    """Short identifier of a key, stored in container headers."""
+    return hashlib.sha256(_container_key(key)).digest()[:8]
+
+def _chunk_nonce(prefix: bytes, counter: int) -> bytes:
+    return prefix + struct.pack(">Q", counter)
+
+def _chunk_aad(header: bytes, index: int, is_last: bool) -> bytes:
+    return header + struct.pack(">QB", index, 1 if is_last else 0)
+
+def is_chunked_container(data) -> bool:
+    """True if ``data`` (bytes or a path) starts with the container magic."""
+    if isinstance(data, (bytes, bytearray)):
+        return bytes(data[:len(CHUNK_MAGIC)]) in (CHUNK_MAGIC, CHUNK_MAGIC_V1)
+    try:
+        with open(data, "rb") as fh:
+            return fh.read(len(CHUNK_MAGIC)) in (CHUNK_MAGIC, CHUNK_MAGIC_V1)
+    except OSError:
+        return False
+
+def read_key_id(path: str) -> bytes:
+    """Key id from a container header, or ``None`` for Fernet/plain files."""
+    try:
+        with open(path, "rb") as fh:
+            header = fh.read(_HEADER.size)
+    except OSError:
+        return None
+    if len(header) < _HEADER_V1.size or header[:len(CHUNK_MAGIC)] not in (CHUNK_MAGIC, CHUNK_MAGIC_V1):
+        return None
+    return _HEADER_V1.unpack_from(header)[1]
+
+def encrypt_stream(src, dst, key, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """Encrypt file object ``src`` into ``dst`` as a chunked container, one chunk in memory at a time."""
+    key = _as_keys(key)[0]
+    salt = os.urandom(32)
+    aead = AESGCM(_file_key(key, salt))
+    prefix = _NONCE_PREFIX
+    header = _HEADER.pack(CHUNK_MAGIC, key_id(key), chunk_size, salt)
+    dst.write(header)
+    offset = len(header)
+    index = []
+    current = src.read(chunk_size)
+    i = 0
+    while True:
+        following = src.read(chunk_size) if len(current) == chunk_size else b""
+        is_last = not following
+        sealed = aead.encrypt(_chunk_nonce(prefix, i), current, _chunk_aad(header, i, is_last))
+        dst.write(sealed)
+        index.append(_INDEX_ENTRY.pack(offset, len(current)))
+        offset += len(sealed)
+        if is_last:
+            break
+        current = following
+        i += 1
+    sealed_index = aead.encrypt(_chunk_nonce(prefix, _INDEX_COUNTER), b"".join(index), header)
+    dst.write(sealed_index)
+    dst.write(_TRAILER.pack(len(index), len(sealed_index), CHUNK_END_MAGIC))
+
+class ChunkedReader:
+    """Random-access reader over a chunked container opened as a seekable file object."""
+
+    def __init__(self, fileobj, key):
+        self._fh = fileobj
+        self._fh.seek(0)
+        magic = self._fh.read(len(CHUNK_MAGIC))
+        layout = {CHUNK_MAGIC: _HEADER, CHUNK_MAGIC_V1: _HEADER_V1}.get(magic)
+        if layout is None:
+            raise InvalidToken("not a chunked container")
+        self._fh.seek(0)
+        self.header = self._fh.read(layout.size)
+        if len(self.header) < layout.size:
+            raise InvalidToken("truncated chunked container")
+        _, self.key_id, self.chunk_size, salt = layout.unpack(self.header)
+        matching = [k for k in _as_keys(key) if key_id(k) == self.key_id]
+        if not matching:
+            raise InvalidToken("no key available for this container's key id")
+        if magic == CHUNK_MAGIC:
+            self._aead, self._prefix = AESGCM(_file_key(matching[0], salt)), _NONCE_PREFIX
+        else:
+            self._aead, self._prefix = AESGCM(_container_key(matching[0])), salt
+        self._fh.seek(-_TRAILER.size, os.SEEK_END)
+        count, index_len, end_magic = _TRAILER.unpack(self._fh.read(_TRAILER.size))
+        if end_magic != CHUNK_END_MAGIC:
+            raise InvalidToken("truncated chunked container")
+        self._fh.seek(-(_TRAILER.size + index_len), os.SEEK_END)
+        try:
+            raw_index = self._aead.decrypt(_chunk_nonce(self._prefix, _INDEX_COUNTER),
+                                           self._fh.read(index_len), self.header)
+        except InvalidTag:
+            raise InvalidToken("chunked container index failed authentication")
+        # The trailer is not authenticated; the chunk count comes from the sealed index
+        if len(raw_index) % _INDEX_ENTRY.size or len(raw_index) // _INDEX_ENTRY.size != count:
+            raise InvalidToken("chunked container trailer does not match its index")
+        self._index = [entry for entry in _INDEX_ENTRY.iter_unpack(raw_index)]
+
+    @property
+    def chunk_count(self) -> int:
+        return len(self._index)
+
+    @property
+    def size(self) -> int:
+        """Plaintext size in bytes."""
+        return sum(length for _, length in self._index)
+
+    def read_chunk(self, i: int) -> bytes:
+        offset, length = self._index[i]
+        self._fh.seek(offset)
+        sealed = self._fh.read(length + _TAG_SIZE)
+        is_last = i == len(self._index) - 1
+        try:
+            return self._aead.decrypt(_chunk_nonce(self._prefix, i), sealed, _chunk_aad(self.header, i, is_last))
+        except InvalidTag:
+            raise InvalidToken(f"chunk {i} failed authentication")
+
+    def read(self, offset: int = 0, size: int = -1) -> bytes:
+        """Read ``size`` plaintext bytes from ``offset``, decrypting only the chunks involved."""
+        end = self.size if size < 0 else min(self.size, offset + size)
+        out = []
+        first = offset // self.chunk_size
+        for i in range(first, len(self._index)):
+            start = i * self.chunk_size
+            if start >= end:
+                break
+            chunk = self.read_chunk(i)
+            out.append(chunk[max(0, offset - start):end - start])
+        return b"".join(out)
+
+    def __iter__(self):
+        for i in range(len(self._index)):
+            yield self.read_chunk(i)
+
+def decrypt_stream(src, dst, key):
+    """Decrypt a chunked container from seekable ``src`` into ``dst`` one chunk at a time."""
+    for chunk in ChunkedReader(src, key):
+        dst.write(chunk)
+
 # ----------------- ENCRYPT / DECRYPT FILES -----------------
-def encrypt_file(src_path: str, key: bytes, dst_path: str = None):
-    """Encrypt a file using Fernet."""
+_path_locks = {}
+_path_locks_guard = threading.Lock()
+
+def path_lock(path: str) -> threading.RLock:
+    """Per-file lock so a re-encryption cannot interleave with a backup of the same file."""
+    path = os.path.abspath(path)
+    with _path_locks_guard:
+        return _path_locks.setdefault(path, threading.RLock())
+
+def _atomic_write(dst_path: str, writer):
+    """Run ``writer(fileobj)`` into a temp file beside ``dst_path`` and rename it into place."""
+    with path_lock(dst_path):
+        _atomic_write_unlocked(dst_path, writer)
+
+def _atomic_write_unlocked(dst_path: str, writer):
+    dst_dir = os.path.dirname(os.path.abspath(dst_path))
+    fd, tmp_path = tempfile.mkstemp(dir=dst_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            writer(fh)
+        os.replace(tmp_path, dst_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def encrypt_file(src_path: str, key, dst_path: str = None):
+    """Encrypt a file into the chunked container format, streaming it chunk by chunk."""
     if not os.path.exists(src_path):
         return
-    f = Fernet(key)
-    data = Path(src_path).read_bytes()
-    token = f.encrypt(data)
-    Path(dst_path or src_path).write_bytes(token)
-
-def decrypt_file(src_path: str, key: bytes, dst_path: str = None):
-    """Decrypt a file; raises InvalidToken if invalid."""
-    f = Fernet(key)
+    with open(src_path, "rb") as src:
+        _atomic_write(dst_path or src_path, lambda dst: encrypt_stream(src, dst, key))
+
+def decrypt_file(src_path: str, key, dst_path: str = None):
+    """Decrypt a file; raises InvalidToken if invalid.
+
+    Chunked containers are streamed; older Fernet files are still accepted.
+    ``key`` may be a keyring list from ``load_keys``.
+    """
+    if is_chunked_container(src_path):
+        with open(src_path, "rb") as src:
+            _atomic_write(dst_path or src_path, lambda dst: decrypt_stream(src, dst, key))
+        return
     token = Path(src_path).read_bytes()
-    data = f.decrypt(token)
+    data = _fernet(key).decrypt(token)
     Path(dst_path or src_path).write_bytes(data)
 
-def safe_decrypt_file(src_path: str, key: bytes, dst_path: str):
+def safe_decrypt_file(src_path: str, key, dst_path: str):
     """Try to decrypt; if not encrypted, copy plain file."""
     if not os.path.exists(src_path):
         return
     try:
-        f = Fernet(key)
-        token = Path(src_path).read_bytes()
-        data = f.decrypt(token)
-        Path(dst_path).write_bytes(data)
+        decrypt_file(src_path, key, dst_path=dst_path)
     except (InvalidToken, Exception):
         # Not encrypted or error -> copy file directly
         shutil.copy2(src_path, dst_path)
 
-def ensure_encrypted_backup(src_path: str, key: bytes):
-    """Create encrypted backup of the file."""
+def ensure_encrypted_backup(src_path: str, key, data: bytes = None):
+    """Create encrypted backup of the file.
+
+    Pass ``data`` when the plaintext is already in memory to avoid re-reading it.
+    """
+    backup_path = f"{src_path}.enc"
+    if data is not None:
+        encrypt_from_buffer(data, key, backup_path)
+        return
     if not os.path.exists(src_path):
         return
-    backup_path = f"{src_path}.enc"
     encrypt_file(src_path, key, dst_path=backup_path)
 
+# ----------------- IN-MEMORY ENCRYPT / DECRYPT -----------------
+def decrypt_to_buffer(src_path: str, key, strict: bool = True) -> io.BytesIO:
+    """Read a file into memory, decrypting it.
+
+    Chunked containers and Fernet tokens are detected automatically. A file
+    that cannot be decrypted raises InvalidToken, like ``decrypt_file``; pass
+    ``strict=False`` to get plain files back as-is, mirroring ``safe_decrypt_file``.
+    Returns ``None`` if the file does not exist.
+    """
+    if not os.path.exists(src_path):
+        return None
+    raw = Path(src_path).read_bytes()
+    if is_chunked_container(raw):
+        out = io.BytesIO()
+        decrypt_stream(io.BytesIO(raw), out, key)
+        out.seek(0)
+        return out
+    try:
+        raw = _fernet(key).decrypt(raw)
+    except (InvalidToken, Exception):
+        if strict:
+            raise InvalidToken(f"{src_path} could not be decrypted with the available keys")
+    return io.BytesIO(raw)
+
+def encrypt_from_buffer(data, key, dst_path: str):
+    """Encrypt in-memory bytes (or a BytesIO) into a chunked container at ``dst_path``."""
+    if isinstance(data, (bytes, bytearray)):
+        data = io.BytesIO(data)
+    data.seek(0)
+    _atomic_write(dst_path, lambda dst: encrypt_stream(data, dst, key))
+
+# ----------------- BACKGROUND BACKUPS -----------------
+class BackupScheduler:
+    """Run encrypted backups on a worker thread, off the request/Tk thread.
+
+    Repeated requests for the same file within ``coalesce_window`` seconds are
+    merged into one backup of the newest contents.
+    """
+
+    def __init__(self, coalesce_window: float = 2.0):
+        self.coalesce_window = coalesce_window
+        self._pending = {}  # path -> {"key", "data", "requested"}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._busy = 0
+        self.last_success = {}  # path -> epoch seconds
+        self.last_error = {}  # path -> message
+        self.coalesced = 0
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        """A forked child starts its own backup thread on the first ``schedule``."""
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._busy = 0
+
+    def schedule(self, src_path: str, key: bytes = None, data: bytes = None):
+        """Queue a backup of ``src_path``; ``data`` is the plaintext if already in memory.
+
+        With ``key=None`` the primary key is resolved when the backup runs, so
+        queued backups follow a key rotation.
+        """
+        with self._cond:
+            entry = self._pending.get(src_path)
+            if entry is None:
+                self._pending[src_path] = {"key": key, "data": data, "requested": time.time()}
+            else:
+                entry["key"], entry["data"] = key, data
+                self.coalesced += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="backup-scheduler", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def cancel(self, src_path: str):
+        """Drop a pending backup, e.g. when the source file is being deleted."""
+        with self._cond:
+            self._pending.pop(src_path, None)
+
+    def cancel_under(self, directory: str):
+        """Drop every pending backup for files inside ``directory``."""
+        root = os.path.join(os.path.abspath(directory), "")
+        with self._cond:
+            for path in [p for p in self._pending if os.path.abspath(p).startswith(root)]:
+                del self._pending[path]
+
+    def _take_due(self, force=False):
+        now = time.time()
+        due = [p for p, e in self._pending.items() if force or now - e["requested"] >= self.coalesce_window]
+        return [(p, self._pending.pop(p)) for p in due]
+
+    def _backup(self, path, entry):
+        try:
+            with path_lock(f"{path}.enc"):
+                key = entry["key"] or load_key()
+                ensure_encrypted_backup(path, key, data=entry["data"])
+            self.last_success[path] = time.time()
+            self.last_error.pop(path, None)
+        except Exception as e:
+            self.last_error[path] = str(e)
+            print(f"[ERROR] Encrypted backup of {path} failed: {e}")
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                due = self._take_due()
+                if not due:
+                    oldest = min(e["requested"] for e in self._pending.values())
+                    self._cond.wait(max(0.0, oldest + self.coalesce_window - time.time()))
+                    continue
+                self._busy += 1
+            try:
+                for path, entry in due:
+                    self._backup(path, entry)
+            finally:
+                with self._cond:
+                    self._busy -= 1
+                    self._cond.notify_all()
+
+    def flush(self, timeout: float = None):
+        """Write every pending backup now, waiting for in-flight ones to finish."""
+        with self._cond:
+            due = self._take_due(force=True)
+        for path, entry in due:
+            self._backup(path, entry)
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._busy:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+    def status(self) -> dict:
+        """Backup lag (age of the oldest pending request) and last success per file."""
+        with self._cond:
+            now = time.time()
+            oldest = min((e["requested"] for e in self._pending.values()), default=None)
+            return {
+                "pending": len(self._pending),
+                "lag_seconds": round(now - oldest, 3) if oldest is not None else 0.0,
+                "coalesced": self.coalesced,
+                "last_success": {p: datetime.fromtimestamp(t).isoformat(timespec="seconds")
+                                 for p, t in self.last_success.items()},
+                "errors": dict(self.last_error),
+            }
+
+backup_scheduler = BackupScheduler()
+
+def schedule_encrypted_backup(src_path: str, key: bytes = None, data: bytes = None):
+    """Queue an encrypted backup on the shared background scheduler."""
+    backup_scheduler.schedule(src_path, key, data=data)
+
 # ----------------- TEMPORARY FILE CLEANUP -----------------
 _temp_files = set()
 
@@ -93,3 +481,4 @@ def safe_temp_file():
 
 # Register cleanup function to run on exit
 atexit.register(cleanup_temp_files)
+atexit.register(backup_scheduler.flush)
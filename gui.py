@@ -1,12 +1,19 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
+from tkinter import messagebox, simpledialog
 import cv2
 from PIL import Image, ImageTk
 import os
+import time
+import queue
+import threading
 import pandas as pd
 from datetime import datetime
 from settings import config
-from recognition import FaceRecognitionSystem
+from model_server import create_face_system
+from attendance import AttendanceRegister
+from attendance_table import AttendanceTableModel, VirtualTable
+from metrics import metrics
+import profiling
 
 class FaceRecognitionApp:
     def __init__(self, root):
@@ -16,7 +23,7 @@ class FaceRecognitionApp:
         
         # Initialize systems
         try:
-            self.face_system = FaceRecognitionSystem()
+            self.face_system = create_face_system()
             self.cap = cv2.VideoCapture(config.camera_index)
             self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, config.frame_width)
             self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, config.frame_height)
@@ -25,10 +32,11 @@ class FaceRecognitionApp:
             self.face_system = None
             self.cap = None
         
-        self.setup_ui()
-        self.load_attendance_data()
-        self.auto_refresh_attendance()
         self.running = True
+        self.setup_ui()
+        self.setup_table()
+        self.root.after(config.metrics_log_interval * 1000, self.log_metrics)
+        self.start_workers()
         self.update_frame()
     
     def setup_ui(self):
@@ -58,6 +66,8 @@ class FaceRecognitionApp:
                  bg="#FF9800", fg="white", font=("Arial", 10, "bold")).pack(side=tk.LEFT, padx=5)
         tk.Button(btn_frame, text="Reset", command=self.reset_system,
                  bg="#F44336", fg="white", font=("Arial", 10, "bold")).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Profile", command=self.profile_frame_loop,
+                 bg="#607D8B", fg="white", font=("Arial", 10, "bold")).pack(side=tk.LEFT, padx=5)
         
         # Status log
         log_frame = tk.Frame(left_frame)
@@ -77,15 +87,9 @@ class FaceRecognitionApp:
         tk.Button(controls_frame, text="Full View", command=self.toggle_view,
                  bg="#9C27B0", fg="white").pack(side=tk.RIGHT)
         
-        # Attendance table
-        tree_frame = tk.Frame(right_frame)
-        tree_frame.pack(fill="both", expand=True)
-        
-        self.tree = ttk.Treeview(tree_frame, show="headings")
-        yscroll = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=yscroll.set)
-        self.tree.pack(side=tk.LEFT, fill="both", expand=True)
-        yscroll.pack(side=tk.RIGHT, fill="y")
+        # Attendance table (filled by setup_table)
+        self.tree_frame = tk.Frame(right_frame)
+        self.tree_frame.pack(fill="both", expand=True)
         
         self.compact_view = True
 
@@ -96,37 +100,143 @@ class FaceRecognitionApp:
         self.log_text.config(state="disabled")
         self.log_text.see(tk.END)
 
+    def log_metrics(self):
+        """Periodically write the headline counters and stage latencies to the status log."""
+        self.log(f"[METRICS] {metrics.summary_line()}")
+        self.root.after(config.metrics_log_interval * 1000, self.log_metrics)
+
+    def profile_frame_loop(self, seconds=None):
+        """Sample the Tk thread and the camera/recognition/mark workers for a few seconds and save a flamegraph profile."""
+        seconds = seconds or config.profile_gui_seconds
+        if getattr(self, "_profiler", None) and self._profiler.is_running():
+            self.log("[INFO] A profile is already running")
+            return
+        threads = [threading.get_ident()] + [t.ident for t in self.workers]
+        self._profiler = profiling.profile_for(seconds, "update_frame", threads)
+        self.log(f"[INFO] Profiling the recognition loop for {seconds}s -> {config.profiles_dir}")
+
+    # ---------------- Camera and Recognition Workers ----------------
+    def start_workers(self):
+        """Capture, recognition and marking each run on their own thread; Tk only draws."""
+        self._frame_cond = threading.Condition()
+        self._frame, self._frame_seq = None, 0  # newest camera frame; older ones are dropped
+        self._overlay = []  # newest recognition results
+        self._recognizer_lock = threading.Lock()  # The models are not shared between threads
+        self._latency_ms = 0.0
+        self._marks = queue.Queue()
+        self._pending_marks = set()
+        self._messages = queue.Queue()  # Log lines from workers, written by the Tk thread
+        self._photo, self._drawn_seq = None, 0
+        self._fps, self._last_draw = 0.0, None
+        self.workers = []
+        if self.cap is None or self.face_system is None:
+            return
+        for target, name in [(self.capture_loop, "gui-capture"), (self.recognition_loop, "gui-recognition"),
+                             (self.mark_loop, "gui-marks")]:
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self.workers.append(thread)
+
+    def capture_loop(self):
+        """Keep only the newest camera frame; the display and the recognizer each take it when ready."""
+        while self.running:
+            ret, frame = self.cap.read()
+            if not ret:
+                time.sleep(0.05)
+                continue
+            frame = cv2.flip(frame, 1)
+            with self._frame_cond:
+                self._frame = frame
+                self._frame_seq += 1
+                self._frame_cond.notify_all()
+
+    def recognition_loop(self):
+        """Recognize the newest frame, publish its overlay and queue marks for new students."""
+        seen = 0
+        while self.running:
+            with self._frame_cond:
+                self._frame_cond.wait_for(lambda: self._frame_seq != seen or not self.running, timeout=1.0)
+                frame, seen = self._frame, self._frame_seq
+            if frame is None:
+                continue
+            try:
+                with self._recognizer_lock:
+                    started = time.perf_counter()
+                    results = self.face_system.detect_and_recognize_faces(frame)
+                    elapsed = time.perf_counter() - started
+                # Frames between recognitions reuse cached results; only recognized ones count as latency
+                if self.face_system.session().frame_count % config.process_every_n_frames == 0:
+                    self._latency_ms = elapsed * 1000
+            except Exception as e:
+                self._messages.put(f"[ERROR] Recognition error: {e}")
+                time.sleep(0.5)
+                continue
+            self._overlay = results
+            for res in results:
+                sid = res["id"]
+                if sid is None or sid in self.face_system.attendance_marked or sid in self._pending_marks:
+                    continue
+                self._pending_marks.add(sid)
+                self._marks.put((sid, res["name"]))
+
+    def mark_loop(self):
+        """Persist marks off the Tk thread; a register write can take a while."""
+        while self.running:
+            try:
+                sid, name = self._marks.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            try:
+                self.face_system.mark_attendance(sid, name)
+            except Exception as e:
+                self._messages.put(f"[ERROR] Marking {name} failed: {e}")
+            finally:
+                self._pending_marks.discard(sid)
+
     # ---------------- Video Frame Update ----------------
     def update_frame(self):
+        """Draw the newest frame with the newest overlay and the loop stats, at ``display_fps``."""
         try:
+            while not self._messages.empty():
+                self.log(self._messages.get_nowait())
             if self.cap is None or self.face_system is None:
                 self.video_label.configure(text="Camera or Face Recognition not available", bg="red", fg="white")
                 if self.running:
                     self.root.after(1000, self.update_frame)
                 return
-                
-            ret, frame = self.cap.read()
-            if not ret:
+
+            with self._frame_cond:
+                frame, seq = self._frame, self._frame_seq
+            if frame is None or seq == self._drawn_seq:
                 return
-            frame = cv2.flip(frame, 1)
-            results = self.face_system.detect_and_recognize_faces(frame)
-            for res in results:
+            self._drawn_seq = seq
+            frame = frame.copy()  # The recognizer may still be reading the original
+            for res in self._overlay:
                 (l, t, r, b) = res["location"]
-                name, sid = res["name"], res["id"]
+                name = res["name"]
                 color = (0, 255, 0) if name != "Unknown" else (0, 0, 255)
                 cv2.rectangle(frame, (l, t), (r, b), color, 2)
                 cv2.putText(frame, f"{name}", (l, t - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
-                self.face_system.mark_attendance(sid, name)
-            img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(img)
-            imgtk = ImageTk.PhotoImage(image=img)
-            self.video_label.imgtk = imgtk
-            self.video_label.configure(image=imgtk)
+
+            now = time.perf_counter()
+            if self._last_draw is not None:
+                self._fps = 0.9 * self._fps + 0.1 / max(now - self._last_draw, 1e-3)
+            self._last_draw = now
+            stats = (f"FPS {self._fps:.0f} | recognition {self._latency_ms:.0f} ms | "
+                     f"marks queued {len(self._pending_marks)}")
+            cv2.putText(frame, stats, (10, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
+
+            img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            if self._photo is None or (self._photo.width(), self._photo.height()) != img.size:
+                self._photo = ImageTk.PhotoImage(image=img)
+                self.video_label.configure(image=self._photo)
+            else:
+                self._photo.paste(img)  # Reuse the Tk image instead of creating one per frame
         except Exception as e:
             self.log(f"[ERROR] Frame update error: {e}")
         finally:
-            if self.running:
-                self.root.after(10, self.update_frame)
+            if self.running and self.cap is not None and self.face_system is not None:
+                self.root.after(max(1, 1000 // config.display_fps), self.update_frame)
 
     # ---------------- Student Import ----------------
     def import_students_from_excel(self):
@@ -144,11 +254,10 @@ class FaceRecognitionApp:
             df = df.dropna(subset=["StudentID", "Name"]).copy()
             df["Name"] = df["Name"].astype(str).str.strip()
             df = df[df["Name"] != ""]
-            for _, row in df.iterrows():
-                sid, name = row["StudentID"], row["Name"]
-                self.face_system.register.add_student(sid, name)
-            self.load_attendance_data()
-            self.log("Students imported from Excel successfully.")
+            records = list(zip(df["StudentID"].tolist(), df["Name"].tolist()))
+            result = self.face_system.register.add_students_bulk(records)
+            self.log(f"Students imported from Excel successfully "
+                     f"({len(result['added'])} added, {len(result['skipped'])} skipped).")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to import students: {e}")
 
@@ -164,21 +273,16 @@ class FaceRecognitionApp:
         if not name:
             return
 
-        # Check if student already exists
-        if not os.path.exists(config.excel_file):
-            df = pd.DataFrame(columns=["StudentID", "Name"])
-            df.to_excel(config.excel_file, index=False)
-
         try:
-            df = pd.read_excel(config.excel_file)
-            if sid in df["StudentID"].values:
+            # Check if student already exists
+            register = self.face_system.register
+            df = register.load_daily()
+            if "StudentID" in df.columns and sid in df["StudentID"].values:
                 messagebox.showwarning("Warning", f"Student ID {sid} already exists!")
                 return
 
-            # Add to Excel
-            new_row = pd.DataFrame([[sid, name]], columns=["StudentID", "Name"])
-            df = pd.concat([df, new_row], ignore_index=True)
-            df.to_excel(config.excel_file, index=False)
+            # Add to the registers through the shared writer
+            register.add_student(sid, name)
 
             # Capture face samples
             messagebox.showinfo("Face Capture", f"Look at the camera. Capturing {config.samples_per_student} samples for {name}")
@@ -198,17 +302,8 @@ class FaceRecognitionApp:
                         collected = self.capture_samples(prompt="Please look directly at camera for better recognition")
 
                 # Add encodings
-                for enc in collected:
-                    self.face_system.known_face_encodings.append(enc)
-                    self.face_system.known_face_names.append(name)
-                    self.face_system.known_face_ids.append(sid)
-                    if not self.face_system.known_face_unique_ids:
-                        self.face_system.known_face_unique_ids = [None] * (len(self.face_system.known_face_encodings) - 1)
-                    self.face_system.known_face_unique_ids.append(None)
-                
-                self.face_system._save_encodings()
+                self.face_system.add_student_encodings(sid, name, collected)
                 self.face_system.register.add_student(sid, name)
-                self.load_attendance_data()
                 self.log(f"[SUCCESS] Added {name} (ID: {sid}) successfully!")
             else:
                 messagebox.showwarning("Warning", "Failed to capture face samples. Please try again.")
@@ -221,17 +316,31 @@ class FaceRecognitionApp:
             messagebox.showinfo("Capture", prompt)
         collected = []
         attempts = 0
+        seen = 0
         while len(collected) < config.samples_per_student and attempts < config.samples_per_student * 5:
             attempts += 1
-            ret, frame = self.cap.read()
-            frame = cv2.flip(frame, 1)
-            detections = self.face_system.detect_and_encode(frame)
+            frame, seen = self._next_frame(seen)
+            if frame is None:
+                continue
+            with self._recognizer_lock:
+                detections = self.face_system.detect_and_encode(frame)
             if len(detections) == 1:
                 collected.append(detections[0]["encoding"])
             self.root.update_idletasks()
             self.root.update()
         return collected
 
+    def _next_frame(self, seen, timeout=2.0):
+        """Wait for a camera frame newer than ``seen`` while keeping the window responsive."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._frame_cond:
+                if self._frame is not None and self._frame_seq != seen:
+                    return self._frame, self._frame_seq
+            self.root.update()
+            time.sleep(0.01)
+        return None, seen
+
     # ---------------- Update Attendance ----------------
     def update_attendance(self):
         self.load_attendance_data()
@@ -241,53 +350,44 @@ class FaceRecognitionApp:
     def show_paths(self):
         paths = f"Attendance Excel: {os.path.abspath(config.excel_file)}\n" \
                 f"Yearly Excel: {os.path.abspath(config.yearly_file)}\n" \
-                f"Master Excel: {os.path.abspath(getattr(config,'master_file','attendance_master.xlsx'))}\n" \
+                f"Master/Calendar partitions: {os.path.abspath(os.path.join(config.data_dir, 'partitions'))}\n" \
                 f"Encodings: {os.path.abspath(config.encodings_file)}"
         messagebox.showinfo("File Paths", paths)
 
-    # ---------------- Load Attendance to Tree ----------------
-    def load_attendance_data(self):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        if not os.path.exists(config.excel_file):
+    # ---------------- Attendance Table ----------------
+    def setup_table(self):
+        """Bind the table to the register; it follows change notifications from then on."""
+        try:
+            register = self.face_system.register if self.face_system is not None else AttendanceRegister()
+            self.table_model = AttendanceTableModel(register)
+            self.table_model.load()
+        except Exception as e:
+            self.table_model = None
+            self.log(f"[ERROR] Could not load attendance: {e}")
             return
-        df = pd.read_excel(config.excel_file)
-        # Hide rows with NaN/blank StudentID or Name
-        if "StudentID" in df.columns and "Name" in df.columns:
-            df = df.dropna(subset=["StudentID", "Name"]).copy()
-            df["Name"] = df["Name"].astype(str).str.strip()
-            df = df[df["Name"] != ""]
-        # Ensure clean, compact default view
-        if self.compact_view:
-            today_col = datetime.now().date().isoformat()
-            display_df = df.copy()
-            if today_col not in display_df.columns:
-                display_df[today_col] = 'A'
-            display_df = display_df[["StudentID", "Name", today_col]]
-            columns = list(display_df.columns)
-            self.tree["columns"] = columns
-            for col in columns:
-                self.tree.heading(col, text=col)
-                self.tree.column(col, width=140 if col == "Name" else 110)
-            for _, row in display_df.iterrows():
-                self.tree.insert("", "end", values=[row[c] for c in columns])
-        else:
-            columns = list(df.columns)
-            self.tree["columns"] = columns
-            for col in columns:
-                self.tree.heading(col, text=col)
-                self.tree.column(col, width=100)
-            for _, row in df.iterrows():
-                self.tree.insert("", "end", values=list(row))
+        self.table = VirtualTable(self.tree_frame, self.table_model, compact=self.compact_view)
+        self.root.after(config.table_poll_interval_ms, self.poll_attendance)
+
+    def load_attendance_data(self):
+        """Re-read the register in the background; the table updates when the read lands."""
+        if self.table_model is not None:
+            self.table_model.resync()
+
+    def poll_attendance(self):
+        """Apply register changes to the table; only changed rows in view are redrawn."""
+        try:
+            changed, structure = self.table_model.drain()
+            self.table.update_rows(changed, structure)
+        except Exception as e:
+            self.log(f"[ERROR] Attendance table update error: {e}")
+        finally:
+            if self.running:
+                self.root.after(config.table_poll_interval_ms, self.poll_attendance)
 
     def toggle_view(self):
         self.compact_view = not self.compact_view
-        self.load_attendance_data()
-
-    # ---------------- Auto Refresh ----------------
-    def auto_refresh_attendance(self):
-        self.load_attendance_data()
-        self.root.after(10000, self.auto_refresh_attendance)
+        if self.table_model is not None:
+            self.table.set_compact(self.compact_view)
 
     # ---------------- Reset System ----------------
     def reset_system(self):
@@ -298,21 +398,20 @@ class FaceRecognitionApp:
         # Delete face encodings
         if os.path.exists(config.encodings_file):
             os.remove(config.encodings_file)
-        self.face_system.known_face_encodings.clear()
-        self.face_system.known_face_names.clear()
-        self.face_system.known_face_ids.clear()
+        self.face_system.clear_gallery()
         self.face_system.attendance_marked.clear()
 
-        # Reset all registers
+        # Reset all registers; the table reloads on the reset notification
         self.face_system.register.reset_all()
-
-        # Reload GUI treeview
-        self.load_attendance_data()
         self.log("System reset: all faces and attendance cleared, registers recreated.")
 
     # ---------------- Quit ----------------
     def quit_app(self):
         self.running = False
+        with self._frame_cond:
+            self._frame_cond.notify_all()
+        for thread in self.workers:
+            thread.join(timeout=2.0)  # The capture thread must be out of cap.read() before release
         if self.cap is not None:
             self.cap.release()
         self.root.destroy()
@@ -0,0 +1,130 @@
+"""
+Conditional GETs, compression and a response cache for the read endpoints.
+
+Every read endpoint serves data derived from the attendance registers, so the
+register writer's version counter identifies a response exactly: the ETag is
+the version plus the request URL, a matching ``If-None-Match`` gets a 304, and
+rendered bodies (plain and compressed) are kept in memory until the next write.
+"""
+
+import os
+import gzip
+import zlib
+import threading
+import functools
+from collections import OrderedDict
+from datetime import date
+from email.utils import formatdate
+from flask import request, make_response
+
+try:
+    import brotli
+except ImportError:  # br is optional; gzip is always available
+    brotli = None
+
+
+class ResponseCache:
+    def __init__(self, writer, max_entries=256, min_compress_bytes=1024):
+        self.writer = writer
+        self.max_entries = max_entries
+        self.min_compress_bytes = min_compress_bytes
+        self._entries = OrderedDict()  # url -> {"version", "etag", "body", "mimetype", "headers", "encoded"}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        writer.subscribe(self._on_change)
+
+    def _on_change(self, event):
+        self.invalidate()
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    # ---------------- Helpers ----------------
+    @staticmethod
+    def _etag(version, url):
+        # Views default to "today", so the date is part of the representation too
+        return f"v{version}-{date.today():%Y%m%d}-{zlib.crc32(url.encode()):08x}"
+
+    def _last_modified(self):
+        try:
+            return formatdate(os.path.getmtime(self.writer.version_path), usegmt=True)
+        except OSError:
+            return None
+
+    @staticmethod
+    def _accepted_encoding():
+        accepted = request.accept_encodings
+        if brotli is not None and accepted["br"]:
+            return "br"
+        if accepted["gzip"]:
+            return "gzip"
+        return None
+
+    def _encode(self, entry, encoding):
+        """Compressed body for ``encoding``, computed once per cached response."""
+        if encoding is None or len(entry["body"]) < self.min_compress_bytes:
+            return None, entry["body"]
+        if encoding not in entry["encoded"]:
+            if encoding == "br":
+                entry["encoded"][encoding] = brotli.compress(entry["body"], quality=5)
+            else:
+                entry["encoded"][encoding] = gzip.compress(entry["body"], compresslevel=6)
+        return encoding, entry["encoded"][encoding]
+
+    # ---------------- Decorator ----------------
+    def cached(self, view):
+        """Serve ``view`` through the cache; only successful responses are stored."""
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            version = self.writer.version()
+            url = request.full_path
+            etag = self._etag(version, url)
+            # Each encoding is a distinct representation, so it carries its own strong ETag
+            for candidate in (etag, f"{etag}-gzip", f"{etag}-br"):
+                if request.if_none_match.contains(candidate):
+                    response = make_response("", 304)
+                    response.set_etag(candidate)
+                    response.headers["Vary"] = "Accept-Encoding"
+                    return response
+
+            with self._lock:
+                entry = self._entries.get(url)
+                if entry is not None and entry["version"] == version and entry["etag"] == etag:
+                    self._entries.move_to_end(url)
+                    self.hits += 1
+                else:
+                    entry = None
+                    self.misses += 1
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                entry = {"version": version, "etag": etag, "body": response.get_data(),
+                         "mimetype": response.mimetype, "headers": dict(response.headers), "encoded": {}}
+                with self._lock:
+                    self._entries[url] = entry
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+
+            encoding, body = self._encode(entry, self._accepted_encoding())
+            response = make_response(body, 200)
+            for name, value in entry["headers"].items():
+                if name.lower() not in ("content-length", "content-type"):
+                    response.headers[name] = value
+            response.mimetype = entry["mimetype"]
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+            response.headers["Vary"] = "Accept-Encoding"
+            response.headers["Cache-Control"] = "no-cache"
+            response.set_etag(f"{etag}-{encoding}" if encoding else etag)
+            last_modified = self._last_modified()
+            if last_modified:
+                response.headers["Last-Modified"] = last_modified
+            return response
+        return wrapper
+
+    def status(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,174 @@
+"""
+Online key rotation for Smart Attendance System.
+
+A rotation makes a fresh key primary while keeping the old key readable
+(``secret.key.old``), re-encrypts every encrypted data file in a thread pool,
+and retires the old key once everything has been rewritten. Progress is saved
+to a state file so an interrupted rotation resumes where it stopped.
+"""
+
+import os
+import glob
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from cryptography.fernet import Fernet
+from crypto_utils import (load_key, load_keys, key_id, read_key_id, path_lock,
+                          decrypt_to_buffer, encrypt_from_buffer, backup_scheduler)
+from settings import config
+
+
+class KeyRotation:
+    def __init__(self, key_path="secret.key", data_dir=None, workers=4):
+        self.key_path = key_path
+        self.data_dir = data_dir or config.data_dir
+        self.workers = workers
+        self.state_file = os.path.join(self.data_dir, ".key_rotation.json")
+        self._lock = threading.Lock()
+        self._thread = None
+        self.state = self._load_state()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # The rotation thread stays in the parent; the child re-reads its progress from disk
+        self._lock = threading.Lock()
+        self._thread = None
+        self.state = self._load_state()
+
+    # ---------------- State ----------------
+    def _load_state(self):
+        if os.path.exists(self.state_file):
+            try:
+                return json.loads(Path(self.state_file).read_text())
+            except Exception:
+                pass
+        return {"status": "idle"}
+
+    def _save_state(self):
+        tmp = f"{self.state_file}.tmp"
+        Path(tmp).write_text(json.dumps(self.state, indent=2))
+        os.replace(tmp, self.state_file)
+
+    def status(self):
+        with self._lock:
+            state = dict(self.state)
+        total, done = state.get("total", 0), len(state.get("done", []))
+        state["done"] = done
+        state["progress"] = round(done / total * 100, 1) if total else (100.0 if state["status"] == "done" else 0.0)
+        state["running"] = self.is_running()
+        return state
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    # ---------------- Discovery ----------------
+    def encrypted_files(self):
+        """Every encrypted file the app writes: register backups and the encodings file."""
+        patterns = [os.path.join(self.data_dir, "**", "*.enc"), "*.enc"]
+        files = set()
+        for pattern in patterns:
+            files.update(os.path.normpath(p) for p in glob.glob(pattern, recursive=True))
+        return sorted(files)
+
+    # ---------------- Rotation ----------------
+    def start(self):
+        """Begin a new rotation (or resume an unfinished one) in the background."""
+        with self._lock:
+            if self.is_running():
+                return False
+            if self.state.get("status") not in ("running", "failed"):
+                self._switch_primary_key()
+            self._thread = threading.Thread(target=self.run, name="key-rotation", daemon=True)
+            self._thread.start()
+            return True
+
+    def wait(self, timeout=None):
+        """Block until a running rotation finishes."""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def resume_if_pending(self):
+        """Resume a rotation that was interrupted by a restart."""
+        if self.state.get("status") == "running":
+            return self.start()
+        return False
+
+    def _switch_primary_key(self):
+        old_key = load_key(self.key_path)
+        new_key = Fernet.generate_key()
+
+        # Keep the old key readable until every file has been re-encrypted
+        old_path = Path(f"{self.key_path}.old")
+        retired = old_path.read_bytes().splitlines() if old_path.exists() else []
+        old_path.write_bytes(b"\n".join([old_key] + [k for k in retired if k.strip()]) + b"\n")
+        tmp = f"{self.key_path}.tmp"
+        Path(tmp).write_bytes(new_key)
+        os.replace(tmp, self.key_path)
+
+        self.state = {
+            "status": "running",
+            "started": datetime.now().isoformat(timespec="seconds"),
+            "new_key_id": key_id(new_key).hex(),
+            "total": 0,
+            "done": [],
+            "errors": {},
+        }
+        self._save_state()
+        print(f"[INFO] Key rotation started, new key id {self.state['new_key_id']}")
+
+    def _rotate_file(self, path, keys, new_key):
+        new_id = key_id(new_key)
+        with path_lock(path):
+            if not os.path.exists(path) or read_key_id(path) == new_id:
+                return
+            buf = decrypt_to_buffer(path, keys, strict=True)
+            encrypt_from_buffer(buf, new_key, path)
+
+    def run(self):
+        """Re-encrypt every outstanding file with the primary key, then retire old keys."""
+        started = time.time()
+        # Backups queued under the old key are written (and then rotated) first
+        backup_scheduler.flush()
+        keys = load_keys(self.key_path)
+        new_key = keys[0]
+        with self._lock:
+            self.state["status"] = "running"
+            self.state["errors"] = {}
+            done = set(self.state.get("done", []))
+            files = self.encrypted_files()
+            self.state["total"] = len(files)
+            self._save_state()
+        pending = [p for p in files if p not in done]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self._rotate_file, p, keys, new_key): p for p in pending}
+            for future in as_completed(futures):
+                path = futures[future]
+                with self._lock:
+                    try:
+                        future.result()
+                        self.state["done"].append(path)
+                    except Exception as e:
+                        self.state["errors"][path] = str(e)
+                        print(f"[ERROR] Key rotation failed for {path}: {e}")
+                    self._save_state()
+
+        with self._lock:
+            if self.state["errors"]:
+                # Keep the old key so the failed files stay readable; a later start() retries them
+                self.state["status"] = "failed"
+            else:
+                old_path = Path(f"{self.key_path}.old")
+                if old_path.exists():
+                    old_path.unlink()
+                self.state["status"] = "done"
+                self.state["finished"] = datetime.now().isoformat(timespec="seconds")
+            self.state["elapsed_seconds"] = round(time.time() - started, 2)
+            self._save_state()
+        print(f"[INFO] Key rotation {self.state['status']}: "
+              f"{len(self.state['done'])}/{self.state['total']} files re-encrypted")
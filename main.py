@@ -43,6 +43,11 @@ def main():
     try:
         root = tk.Tk()
         app = FaceRecognitionApp(root)
+        if "--profile" in sys.argv:
+            # python main.py --profile [SECONDS]: profile the recognition loop from startup
+            idx = sys.argv.index("--profile")
+            seconds = float(sys.argv[idx + 1]) if len(sys.argv) > idx + 1 else None
+            app.profile_frame_loop(seconds)
         root.mainloop()
     except Exception as e:
         messagebox.showerror("Application Error", f"Failed to start application: {e}")
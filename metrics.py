@@ -0,0 +1,175 @@
+"""
+Low-overhead counters and latency histograms for Smart Attendance System.
+
+Stages time themselves with ``with metrics.timed("recognition_stage_seconds", stage="detect")``
+and count events with ``metrics.inc(...)``. The server renders everything in
+the Prometheus text format on ``/metrics``; the GUI logs ``summary_line()``.
+
+Metrics are kept per process. Every rendered series carries a ``pid`` label,
+and a forked worker starts from zero, so under ``serve.py`` each scrape of
+``/metrics`` reports the one worker that answered it. Aggregate across workers
+in the query, e.g. ``sum without (pid) (rate(frames_processed_total[5m]))``;
+gauges are per worker too, so take ``max`` or ``avg`` of those.
+"""
+
+import os
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "http_request_seconds": "Time spent handling a request, by endpoint",
+    "recognition_stage_seconds": "Time per recognition stage (base64, decode, detect, landmarks, descriptor, match)",
+    "faces_per_frame": "Faces detected in a processed frame",
+    "register_write_seconds": "Time a register mutation held the writer",
+    "frames_processed_total": "Frames run through face detection",
+    "frames_skipped_total": "Frames answered from the cached results of their session",
+    "faces_matched_total": "Detected faces matched to a student",
+    "faces_unknown_total": "Detected faces that matched no student",
+    "marks_written_total": "Attendance marks that changed the register",
+    "register_bytes_written_total": "Bytes written to register workbooks",
+    "upload_bytes_total": "Encoded frame bytes received",
+    "model_server_seconds": "Round trip of a request to the model server, by operation",
+}
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile (bucket resolution is enough for a log line)."""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}    # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._gauges = {}      # name -> callable
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        """A forked worker counts only its own work; the ``pid`` label tells workers apart."""
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram(buckets)
+            hist.observe(value)
+
+    @contextmanager
+    def timed(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def gauge(self, name, func, help_text=None):
+        """Report ``func()`` whenever metrics are read (e.g. backup lag, queue depth)."""
+        self._gauges[name] = func
+        if help_text:
+            HELP[name] = help_text
+
+    def counter(self, name, **labels):
+        with self._lock:
+            return self._counters.get(self._key(name, labels), 0)
+
+    def histogram(self, name, **labels):
+        with self._lock:
+            return self._histograms.get(self._key(name, labels))
+
+    # ---------------- Output ----------------
+    @staticmethod
+    def _labels(labels, extra=()):
+        items = list(labels) + list(extra)
+        if not items:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+    def render_prometheus(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines, typed = [], set()
+        pid = [("pid", os.getpid())]
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda kv: kv[0])
+            snapshots = [(key, list(h.counts), h.sum, h.count, h.buckets) for key, h in histograms]
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{self._labels(labels, pid)} {value}")
+        for (name, labels), counts, total, count, buckets in snapshots:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, n in zip(buckets, counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{self._labels(labels, pid + [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{self._labels(labels, pid + [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{self._labels(labels, pid)} {total:.6f}")
+            lines.append(f"{name}_count{self._labels(labels, pid)} {count}")
+        for name, func in sorted(self._gauges.items()):
+            try:
+                value = float(func())
+            except Exception:
+                continue
+            header(name, "gauge")
+            lines.append(f"{name}{self._labels((), pid)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary_line(self):
+        """One human-readable line of the headline counters, for the GUI status log."""
+        def ms(name, **labels):
+            hist = self.histogram(name, **labels)
+            return f"{hist.quantile(0.5) * 1000:.0f}/{hist.quantile(0.95) * 1000:.0f}ms" if hist else "-"
+        return (f"frames {self.counter('frames_processed_total')} "
+                f"(skipped {self.counter('frames_skipped_total')}), "
+                f"matched {self.counter('faces_matched_total')}, unknown {self.counter('faces_unknown_total')}, "
+                f"marks {self.counter('marks_written_total')}, "
+                f"detect p50/p95 {ms('recognition_stage_seconds', stage='detect')}, "
+                f"descriptor {ms('recognition_stage_seconds', stage='descriptor')}, "
+                f"register write {ms('register_write_seconds')}")
+
+
+metrics = Registry()
@@ -0,0 +1,404 @@
+"""
+Local model server for Smart Attendance System.
+
+One daemon owns the dlib models and the face gallery and answers
+detect/encode/match requests over a Unix domain socket. The GUI and the
+Flask server on the same machine then share one copy of both instead of
+each loading their own, and an enrollment made in one is seen by the other
+at once. Frames never travel through the socket: the client copies them
+into a shared-memory segment it reuses and sends only the segment name,
+offsets and shapes.
+
+Clients that subscribe receive a ``gallery`` event whenever an enrollment,
+a reset or a reload (SIGHUP, or a client's ``reload_encodings``) changes the
+gallery.
+
+``create_face_system()`` returns a ``RemoteFaceRecognitionSystem`` when the
+daemon is reachable and a local ``FaceRecognitionSystem`` otherwise, so the
+apps work the same without it. The attendance register, the marked-today
+index and per-camera sessions always stay in the client.
+
+The socket is created mode 600 in the data directory: requests are pickled,
+so only the owning user may connect.
+
+Usage: python model_server.py [--socket PATH] [--workers N]
+"""
+
+import os
+import sys
+import time
+import atexit
+import signal
+import socket
+import argparse
+import threading
+from multiprocessing import shared_memory
+from multiprocessing.connection import Listener, Client
+import numpy as np
+from settings import config
+from metrics import metrics
+from recognition import FaceRecognitionSystem, Gallery
+
+
+def available():
+    return config.model_server_enabled and hasattr(socket, "AF_UNIX") and os.path.exists(config.model_socket)
+
+
+def create_face_system():
+    """The model server's thin client if it is running, otherwise a recognizer with its own models."""
+    if available():
+        try:
+            face_system = RemoteFaceRecognitionSystem()
+            print(f"[INFO] Using model server at {config.model_socket}")
+            return face_system
+        except (OSError, EOFError) as e:
+            print(f"[INFO] Model server not reachable ({e}); loading models locally")
+    return FaceRecognitionSystem()
+
+
+# ---------------- Shared-Memory Frames ----------------
+def _attach(name):
+    """Open a client's segment without letting this process's resource tracker unlink it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13 always tracks
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def _frames_view(shm, layout):
+    """The frames a client packed into ``shm``, as arrays over the shared buffer (no copy)."""
+    return [np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset) for offset, shape in layout]
+
+
+# ---------------- Daemon ----------------
+class _GalleryRecognizer(FaceRecognitionSystem):
+    """The daemon's recognizer: models and gallery only, no attendance register."""
+
+    def _init_attendance(self):
+        pass
+
+    def _roll_over_if_needed(self):
+        pass
+
+
+class ModelServer:
+    def __init__(self, path, workers):
+        self.path = path
+        self.workers = max(1, workers)
+        self.recognizer = _GalleryRecognizer()
+        self.recognizer.model_pool_size = self.workers
+        self.gallery_version = 1
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self.connections = 0
+
+    # ---------------- Gallery ----------------
+    def info(self):
+        return {"version": self.gallery_version, "encodings": len(self.recognizer._gallery),
+                "pid": os.getpid()}
+
+    def _gallery_changed(self):
+        with self._lock:
+            self.gallery_version += 1
+            subscribers = list(self._subscribers)
+        event = {"type": "gallery", **self.info()}
+        for conn in subscribers:
+            try:
+                conn.send(event)
+            except OSError:
+                with self._lock:
+                    if conn in self._subscribers:
+                        self._subscribers.remove(conn)
+                conn.close()
+        print(f"[INFO] Gallery version {event['version']}: {event['encodings']} encodings")
+
+    def reload(self):
+        with self.recognizer._gallery_lock:
+            self.recognizer._load_encodings()
+        self._gallery_changed()
+
+    # ---------------- Requests ----------------
+    def _dispatch(self, op, args, frames):
+        rec = self.recognizer
+        if op == "ping":
+            return self.info()
+        if op == "recognize":
+            return rec.recognize_frames(frames)
+        if op == "detect_and_encode":
+            return rec.detect_and_encode(frames[0])
+        if op == "compare_batch":
+            return rec.compare_faces_batch(args["encodings"])
+        if op == "twin_conflict":
+            return rec.find_potential_twin_conflict(args["encoding"])
+        if op in ("add_student_encodings", "replace_student_encodings", "clear_gallery"):
+            getattr(rec, op)(**args)  # Publishes a new gallery snapshot; matches in flight keep the old one
+            self._gallery_changed()
+            return self.info()
+        if op == "reload":
+            self.reload()
+            return self.info()
+        if op == "gallery":
+            version = self.gallery_version  # Read first: a change racing this request then only looks older
+            gallery = rec._gallery
+            return {"version": version, "encodings": list(gallery.encodings), "names": list(gallery.names),
+                    "ids": list(gallery.ids), "unique_ids": list(gallery.unique_ids),
+                    "twins_pairs": [list(p) for p in gallery.twins_pairs]}
+        raise ValueError(f"Unknown request {op!r}")
+
+    def _serve(self, conn):
+        segment = None
+        subscribed = False
+        with self._lock:
+            self.connections += 1
+        try:
+            while True:
+                try:
+                    op, args = conn.recv()
+                except (EOFError, OSError):
+                    break
+                if op == "subscribe":
+                    conn.send({"ok": True, "result": self.info()})
+                    with self._lock:
+                        self._subscribers.append(conn)
+                    subscribed = True
+                    return
+                frames = None
+                if "frames" in args:
+                    name, layout = args.pop("frames")
+                    if segment is None or segment.name != name:
+                        if segment is not None:
+                            segment.close()
+                        segment = _attach(name)
+                    frames = _frames_view(segment, layout)
+                try:
+                    reply = {"ok": True, "result": self._dispatch(op, args, frames)}
+                except Exception as e:
+                    print(f"[ERROR] Model server {op} failed: {e}")
+                    reply = {"ok": False, "error": str(e)}
+                del frames  # Views pin the segment's buffer
+                conn.send(reply)
+        finally:
+            with self._lock:
+                self.connections -= 1
+            if segment is not None:
+                segment.close()
+            if not subscribed:
+                conn.close()
+
+    def _log_metrics(self):
+        while True:
+            time.sleep(config.metrics_log_interval)
+            print(f"[METRICS] {self.connections} clients, gallery v{self.gallery_version}; {metrics.summary_line()}")
+
+    def serve_forever(self):
+        if os.path.exists(self.path):
+            try:
+                Client(self.path, family="AF_UNIX").close()
+                raise RuntimeError(f"A model server is already listening on {self.path}")
+            except OSError:
+                os.unlink(self.path)  # Left behind by a server that did not shut down cleanly
+        old_umask = os.umask(0o177)
+        try:
+            listener = Listener(self.path, family="AF_UNIX", backlog=32)
+        finally:
+            os.umask(old_umask)
+        atexit.register(lambda: os.path.exists(self.path) and os.unlink(self.path))
+        threading.Thread(target=self._log_metrics, name="model-server-metrics", daemon=True).start()
+        print(f"[INFO] Model server (pid {os.getpid()}) listening on {self.path} "
+              f"with {len(self.recognizer._gallery)} encodings")
+        while True:
+            try:
+                conn = listener.accept()
+            except OSError as e:
+                print(f"[ERROR] Model server accept failed: {e}")
+                continue
+            threading.Thread(target=self._serve, args=(conn,), name="model-server-conn", daemon=True).start()
+
+
+# ---------------- Client ----------------
+class ModelClient:
+    """Connection to the model server; each thread gets its own socket and frame segment."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._segments = []  # (pid, SharedMemory) created by this client
+        self._segments_lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _state(self):
+        local = self._local
+        # A forked child inherits the parent thread's state; it needs its own socket and segment
+        if getattr(local, "pid", None) != os.getpid():
+            local.pid = os.getpid()
+            local.conn = None
+            local.shm = None
+        if local.conn is None:
+            local.conn = Client(self.path, family="AF_UNIX")
+        return local
+
+    def _pack(self, local, frames):
+        frames = [np.ascontiguousarray(f, dtype=np.uint8) for f in frames]
+        total = max(1, sum(f.nbytes for f in frames))
+        if local.shm is None or local.shm.size < total:
+            if local.shm is not None:
+                self._release(local.shm)
+            local.shm = shared_memory.SharedMemory(create=True, size=total)
+            with self._segments_lock:
+                self._segments.append((os.getpid(), local.shm))
+        layout, offset = [], 0
+        for f in frames:
+            np.ndarray(f.shape, dtype=np.uint8, buffer=local.shm.buf, offset=offset)[...] = f
+            layout.append((offset, f.shape))
+            offset += f.nbytes
+        return local.shm.name, layout
+
+    def _release(self, shm):
+        with self._segments_lock:
+            self._segments = [(pid, s) for pid, s in self._segments if s is not shm]
+        shm.close()
+        shm.unlink()
+
+    def call(self, op, frames=None, **args):
+        """Send one request and wait for its result; reconnects once if the server restarted."""
+        for attempt in range(2):
+            local = self._state()
+            if frames is not None:
+                args["frames"] = self._pack(local, frames)
+            start = time.perf_counter()
+            try:
+                local.conn.send((op, args))
+                reply = local.conn.recv()
+                break
+            except (EOFError, OSError):
+                local.conn = None
+                if attempt:
+                    raise
+        metrics.observe("model_server_seconds", time.perf_counter() - start, op=op)
+        if not reply["ok"]:
+            raise RuntimeError(f"Model server: {reply['error']}")
+        return reply["result"]
+
+    def subscribe(self, callback):
+        """Call ``callback(event)`` for every gallery event, resubscribing if the server restarts."""
+        def listen():
+            while True:
+                try:
+                    conn = Client(self.path, family="AF_UNIX")
+                    conn.send(("subscribe", {}))
+                    # A (re)subscription may have missed changes, so report the current gallery
+                    callback({"type": "gallery", **conn.recv()["result"]})
+                    while True:
+                        callback(conn.recv())
+                except (EOFError, OSError):
+                    time.sleep(1.0)
+
+        def start():
+            threading.Thread(target=listen, name="model-server-events", daemon=True).start()
+
+        start()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=start)  # Threads do not survive a fork; each worker listens itself
+
+    def close(self):
+        with self._segments_lock:
+            mine = [s for pid, s in self._segments if pid == os.getpid()]
+        for shm in mine:
+            try:
+                self._release(shm)
+            except (BufferError, OSError):
+                pass
+
+
+class RemoteFaceRecognitionSystem(FaceRecognitionSystem):
+    """FaceRecognitionSystem whose models and gallery live in the model server."""
+
+    def __init__(self, path=None):
+        self.client = ModelClient(path or config.model_socket)
+        self.gallery = self.client.call("ping")
+        self._gallery_copy = None  # (version, Gallery) fetched from the server on first use
+        self._init_attendance()
+        self.client.subscribe(self._on_gallery_event)
+
+    def _on_gallery_event(self, event):
+        if event["version"] != self.gallery["version"]:
+            print(f"[INFO] Face gallery changed: {event['encodings']} encodings (version {event['version']})")
+        self.gallery = event
+
+    @property
+    def _gallery(self):
+        """Local copy of the server's gallery for the ``known_face_*`` views; refetched after it changes."""
+        copy = self._gallery_copy
+        if copy is None or copy[0] < self.gallery["version"]:
+            data = self.client.call("gallery")
+            copy = self._gallery_copy = (data.pop("version"), Gallery(**data))
+        return copy[1]
+
+    # ---------------- Models ----------------
+    def detect_and_encode(self, frame):
+        return self.client.call("detect_and_encode", frames=[frame])
+
+    def recognize_frames(self, frames):
+        self._roll_over_if_needed()
+        results = self.client.call("recognize", frames=frames)
+        metrics.inc("frames_processed_total", len(frames))
+        self._count_matches(results)
+        return results
+
+    def compare_faces(self, encoding):
+        return self.compare_faces_batch([encoding])[0]
+
+    def compare_faces_batch(self, encodings):
+        return self.client.call("compare_batch", encodings=np.asarray(encodings))
+
+    # ---------------- Gallery ----------------
+    def find_potential_twin_conflict(self, collected_encoding):
+        return self.client.call("twin_conflict", encoding=collected_encoding)
+
+    def add_student_encodings(self, sid, name, new_encodings, unique_id=None):
+        self.gallery = self.client.call("add_student_encodings", sid=sid, name=name,
+                                        new_encodings=list(new_encodings), unique_id=unique_id)
+
+    def replace_student_encodings(self, target_student_id, new_encodings, new_name=None, new_unique_id=None):
+        self.gallery = self.client.call("replace_student_encodings", target_student_id=target_student_id,
+                                        new_encodings=list(new_encodings), new_name=new_name,
+                                        new_unique_id=new_unique_id)
+
+    def clear_gallery(self):
+        self.gallery = self.client.call("clear_gallery")
+
+    def reload_encodings(self):
+        self.gallery = self.client.call("reload")
+        print(f"[INFO] Model server reloaded {self.gallery['encodings']} face encodings")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Smart Attendance model server")
+    parser.add_argument("--socket", default=config.model_socket)
+    parser.add_argument("--workers", type=int, default=config.model_server_workers)
+    args = parser.parse_args()
+    if not hasattr(socket, "AF_UNIX"):
+        print("[ERROR] Unix domain sockets are not available on this platform")
+        sys.exit(1)
+
+    server = ModelServer(args.socket, args.workers)
+
+    def reload_gallery(signum, frame):
+        threading.Thread(target=server.reload, name="gallery-reload", daemon=True).start()
+
+    signal.signal(signal.SIGHUP, reload_gallery)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    except RuntimeError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
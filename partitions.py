@@ -0,0 +1,221 @@
+"""
+Time-partitioned storage for the master and calendar registers.
+
+The master register is stored as one workbook per month and the calendar as
+one workbook per year, under ``<data_dir>/partitions``. A JSON catalog lists
+every partition with its period, path, row count and state, so queries only
+open the partitions that overlap their date range. Partitions of closed past
+years are compacted into one read-only gzip-compressed CSV per year.
+"""
+
+import os
+import json
+import shutil
+import stat
+from pathlib import Path
+import pandas as pd
+from crypto_utils import backup_scheduler
+
+MASTER_COLUMNS = ["StudentID", "Name", "Date", "Status"]
+
+
+class PartitionStore:
+    def __init__(self, data_dir, read_table):
+        """``read_table(path)`` parses a workbook (decrypting it if needed)."""
+        self.root = os.path.join(data_dir, "partitions")
+        self.catalog_path = os.path.join(self.root, "catalog.json")
+        self._read_table = read_table
+        self._cache = {}  # path -> (mtime_ns, size, DataFrame)
+        os.makedirs(self.root, exist_ok=True)
+        self.catalog = self._load_catalog()
+
+    # ---------------- Catalog ----------------
+    def _load_catalog(self):
+        if os.path.exists(self.catalog_path):
+            try:
+                return json.loads(Path(self.catalog_path).read_text())
+            except Exception:
+                pass
+        return {"partitions": {}, "migrated": []}
+
+    def _save_catalog(self):
+        tmp = f"{self.catalog_path}.{os.getpid()}.tmp"
+        Path(tmp).write_text(json.dumps(self.catalog, indent=2, sort_keys=True))
+        os.replace(tmp, self.catalog_path)
+
+    def reload_catalog(self):
+        """Pick up partitions created by another process."""
+        self.catalog = self._load_catalog()
+
+    def record(self, kind, period, path, rows):
+        """Register (or update) an open partition after it has been written."""
+        entry = {"kind": kind, "period": period, "path": path, "rows": int(rows), "state": "open"}
+        if self.catalog["partitions"].get(f"{kind}/{period}") != entry:
+            # Writers hold the register lock, so re-reading here cannot lose another process's entries
+            self.reload_catalog()
+            self.catalog["partitions"][f"{kind}/{period}"] = entry
+            self._save_catalog()
+
+    def entries(self, kind):
+        return [e for e in self.catalog["partitions"].values() if e["kind"] == kind]
+
+    # ---------------- Paths ----------------
+    @staticmethod
+    def period_of(date_str):
+        """Month partition key (``YYYY-MM``) for an ISO date string."""
+        return str(date_str)[:7]
+
+    def master_path(self, period):
+        return os.path.join(self.root, "master", period[:4], f"{period}.xlsx")
+
+    def calendar_path(self, year):
+        return os.path.join(self.root, "calendar", f"{year}.xlsx")
+
+    def compacted_path(self, kind, year):
+        return os.path.join(self.root, kind, f"{year}.csv.gz")
+
+    # ---------------- Reads ----------------
+    def _load(self, path, fmt="xlsx"):
+        """Read a partition file, reusing the parsed frame while the file is unchanged."""
+        st = os.stat(path)
+        cached = self._cache.get(path)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        if fmt == "csv.gz":
+            df = pd.read_csv(path, compression="gzip", dtype={"Date": str})
+        else:
+            df = self._read_table(path)
+        self._cache[path] = (st.st_mtime_ns, st.st_size, df)
+        return df
+
+    def read_master_partition(self, period):
+        """The master rows of one month (empty frame if the month has no data yet)."""
+        entry = self.catalog["partitions"].get(f"master/{period}")
+        if entry and entry["state"] == "compacted":
+            df = self._load(entry["path"], "csv.gz")
+            return df[df["Date"].astype(str).str.startswith(period)].copy()
+        path = self.master_path(period)
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=MASTER_COLUMNS)
+        return self._load(path).copy()
+
+    def is_read_only(self, kind, period):
+        entry = self.catalog["partitions"].get(f"{kind}/{period}")
+        return bool(entry) and entry["state"] == "compacted"
+
+    def master_periods(self, start=None, end=None):
+        """Month keys of the master partitions overlapping ``start``..``end``, newest first."""
+        lo = self.period_of(start) if start else None
+        hi = self.period_of(end) if end else None
+        return sorted((e["period"] for e in self.entries("master")
+                       if not (lo and e["period"] < lo) and not (hi and e["period"] > hi)), reverse=True)
+
+    def query_master(self, start=None, end=None):
+        """Master rows with ``start <= Date <= end`` (ISO strings), touching only overlapping partitions."""
+        lo = self.period_of(start) if start else None
+        hi = self.period_of(end) if end else None
+        paths = {}
+        for e in self.entries("master"):
+            if (lo and e["period"] < lo) or (hi and e["period"] > hi):
+                continue
+            paths[e["path"]] = "csv.gz" if e["state"] == "compacted" else "xlsx"
+        frames = [self._load(p, fmt) for p, fmt in sorted(paths.items()) if os.path.exists(p)]
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            return pd.DataFrame(columns=MASTER_COLUMNS)
+        df = pd.concat(frames, ignore_index=True)
+        dates = df["Date"].astype(str)
+        mask = pd.Series(True, index=df.index)
+        if start:
+            mask &= dates >= str(start)
+        if end:
+            mask &= dates <= str(end)
+        return df[mask].reset_index(drop=True)
+
+    # ---------------- Migration ----------------
+    def migrate_legacy_master(self, legacy_path, write_table):
+        """Split a single-sheet master register into month partitions (once)."""
+        if "master" in self.catalog["migrated"] or not os.path.exists(legacy_path):
+            return
+        df = self._read_table(legacy_path)
+        if not df.empty:
+            df["Date"] = df["Date"].astype(str)
+            for period, part in df.groupby(df["Date"].str[:7]):
+                path = self.master_path(period)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                existing = self.read_master_partition(period)
+                part = pd.concat([existing, part], ignore_index=True) if not existing.empty else part
+                part = part.drop_duplicates(subset=["StudentID", "Date"], keep="last")
+                write_table(part[MASTER_COLUMNS], path)
+                self.record("master", period, path, len(part))
+        os.replace(legacy_path, f"{legacy_path}.migrated")
+        self.catalog["migrated"].append("master")
+        self._save_catalog()
+        print(f"[INFO] Migrated {len(df)} master rows from {legacy_path} into monthly partitions")
+
+    def migrate_legacy_calendar(self, legacy_path):
+        """Move a single-year calendar workbook into its year partition (once)."""
+        if "calendar" in self.catalog["migrated"] or not os.path.exists(legacy_path):
+            return
+        df = self._read_table(legacy_path)
+        years = sorted({str(c)[:4] for c in df.columns[2:] if str(c)[:4].isdigit()})
+        if years:
+            path = self.calendar_path(years[0])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if not os.path.exists(path):
+                os.replace(legacy_path, path)
+                if os.path.exists(f"{legacy_path}.enc"):
+                    os.replace(f"{legacy_path}.enc", f"{path}.enc")
+                self.record("calendar", years[0], path, len(df))
+        self.catalog["migrated"].append("calendar")
+        self._save_catalog()
+
+    # ---------------- Compaction ----------------
+    def compact_closed_years(self, current_year, on_compacted=None):
+        """Fold every partition of a year before ``current_year`` into one read-only ``.csv.gz``.
+
+        ``on_compacted(path)`` is called for each new compacted file (e.g. to back it up).
+        """
+        self.reload_catalog()
+        for kind in ("master", "calendar"):
+            open_entries = [e for e in self.entries(kind)
+                            if e["state"] == "open" and int(e["period"][:4]) < current_year]
+            for year in sorted({e["period"][:4] for e in open_entries}):
+                year_entries = [e for e in open_entries if e["period"][:4] == year]
+                frames = [self._load(e["path"]) for e in year_entries if os.path.exists(e["path"])]
+                out = self.compacted_path(kind, year)
+                if os.path.exists(out):
+                    os.chmod(out, stat.S_IRUSR | stat.S_IWUSR)
+                    frames.insert(0, self._load(out, "csv.gz"))
+                df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+                tmp = f"{out}.{os.getpid()}.tmp"
+                df.to_csv(tmp, index=False, compression="gzip")
+                os.replace(tmp, out)
+                os.chmod(out, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                for e in year_entries:
+                    backup_scheduler.cancel(e["path"])
+                    for p in (e["path"], f"{e['path']}.enc"):
+                        if os.path.exists(p):
+                            os.remove(p)
+                    year_dir = os.path.dirname(e["path"])
+                    if year_dir != os.path.dirname(out) and os.path.isdir(year_dir) and not os.listdir(year_dir):
+                        os.rmdir(year_dir)
+                    e.update({"path": out, "state": "compacted"})
+                self._save_catalog()
+                print(f"[INFO] Compacted {len(year_entries)} {kind} partition(s) of {year} into {out}")
+                if on_compacted:
+                    on_compacted(out)
+
+    # ---------------- Reset ----------------
+    def reset(self):
+        """Delete every partition and the catalog."""
+        def make_writable(func, path, _):
+            os.chmod(path, stat.S_IWUSR | stat.S_IRUSR)
+            func(path)
+        backup_scheduler.cancel_under(self.root)
+        if os.path.exists(self.root):
+            shutil.rmtree(self.root, onerror=make_writable)
+        os.makedirs(self.root, exist_ok=True)
+        self._cache.clear()
+        self.catalog = {"partitions": {}, "migrated": ["master", "calendar"]}
+        self._save_catalog()
@@ -0,0 +1,210 @@
+"""
+On-demand profiling for Smart Attendance System.
+
+Nothing here runs unless asked for. When ``config.profile_requests`` is on, a
+Flask request is profiled when it sends an ``X-Profile`` header or
+``?profile=1`` (plus ``X-Profile-Token`` if ``profile_token`` is set), at most
+once per ``profile_min_interval`` seconds. The GUI's recognition loop is
+profiled from its "Profile" button or ``python main.py --profile SECONDS``.
+
+Two collectors are available:
+- ``sample`` (default): a background thread reads the target thread's stack
+  from ``sys._current_frames()`` every ``profile_sample_interval`` seconds.
+  Overhead is one stack walk per interval.
+- ``cprofile``: deterministic cProfile of the request, saved as ``.pstats``.
+  It also writes caller/callee pairs as collapsed stacks.
+
+Collapsed-stack files (``frame;frame;frame count`` per line) go to
+``config.profiles_dir`` and load directly into flamegraph.pl or speedscope.
+A profile stops after ``profile_max_seconds`` whatever happens.
+"""
+
+import os
+import sys
+import hmac
+import time
+import pstats
+import cProfile
+import threading
+from collections import Counter
+from datetime import datetime
+from settings import config
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _output_path(name, suffix):
+    os.makedirs(config.profiles_dir, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in name)
+    return os.path.join(config.profiles_dir, f"{stamp}-{safe}.{suffix}")
+
+
+def write_collapsed(stacks, name):
+    """Write a ``Counter`` of ``a;b;c`` stacks in collapsed format; returns the path."""
+    path = _output_path(name, "collapsed")
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    return path
+
+
+class SamplingProfiler:
+    """Samples threads' Python stacks at a fixed interval until stopped (or the time limit).
+
+    ``thread_ids`` defaults to the calling thread. With several threads each
+    stack is rooted at the thread's name.
+    """
+
+    def __init__(self, thread_ids=None, interval=None, max_seconds=None):
+        self.thread_ids = list(thread_ids or [threading.get_ident()])
+        self.interval = interval or config.profile_sample_interval
+        self.max_seconds = max_seconds or config.profile_max_seconds
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        deadline = time.monotonic() + self.max_seconds
+        names = {t.ident: t.name for t in threading.enumerate()}
+        rooted = len(self.thread_ids) > 1
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            frames = sys._current_frames()
+            live = [tid for tid in self.thread_ids if tid in frames]
+            if not live:
+                break
+            for tid in live:
+                frame, labels = frames[tid], []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                if rooted:
+                    labels.append(names.get(tid, str(tid)))
+                self.stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def join(self, timeout=None):
+        """Wait for sampling to end (``stop`` or the time limit)."""
+        if self._thread:
+            self._thread.join(timeout)
+
+    def stop(self):
+        self._stop.set()
+        self.join()
+        return self.stacks
+
+
+class CProfileSession:
+    """cProfile of the calling thread; saves ``.pstats`` plus a caller;callee collapsed approximation."""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+        return self
+
+    def stop(self):
+        self.profile.disable()
+        stats = pstats.Stats(self.profile)
+        stacks = Counter()
+        for func, (_, _, tottime, _, callers) in stats.stats.items():
+            label = f"{func[2]} ({os.path.basename(func[0])}:{func[1]})"
+            if not callers:
+                stacks[label] += max(1, int(tottime * 1e6))
+            for caller, (_, _, caller_tottime, _) in callers.items():
+                parent = f"{caller[2]} ({os.path.basename(caller[0])}:{caller[1]})"
+                stacks[f"{parent};{label}"] += max(1, int(caller_tottime * 1e6))
+        self.stats = stats
+        return stacks
+
+    def dump(self, name):
+        path = _output_path(name, "pstats")
+        self.stats.dump_stats(path)
+        return path
+
+
+def start(mode="sample", thread_ids=None):
+    return CProfileSession().start() if mode == "cprofile" else SamplingProfiler(thread_ids).start()
+
+
+def finish(profiler, name):
+    """Stop a profiler and write its output; returns the collapsed-stack path."""
+    stacks = profiler.stop()
+    if isinstance(profiler, CProfileSession):
+        profiler.dump(name)
+    path = write_collapsed(stacks, name)
+    print(f"[INFO] Profile written to {path}")
+    return path
+
+
+def profile_for(seconds, name, thread_ids=None):
+    """Sample ``thread_ids`` (default: the calling thread) for ``seconds`` in the background."""
+    profiler = SamplingProfiler(thread_ids, max_seconds=seconds).start()
+
+    def finish_later():
+        profiler.join()
+        finish(profiler, name)
+
+    threading.Thread(target=finish_later, name="profile-writer", daemon=True).start()
+    return profiler
+
+
+# ---------------- Flask ----------------
+_last_request_profile = None
+_request_profile_lock = threading.Lock()
+
+
+def _request_allowed(token):
+    """Whether this request may be profiled: enabled, authorized, and not too soon after the last one."""
+    global _last_request_profile
+    if not config.profile_requests:
+        return False
+    if config.profile_token and not hmac.compare_digest(token.encode(), config.profile_token.encode()):
+        return False
+    with _request_profile_lock:
+        now = time.monotonic()
+        if _last_request_profile is not None and now - _last_request_profile < config.profile_min_interval:
+            return False
+        _last_request_profile = now
+        return True
+
+
+def init_app(app):
+    """Profile requests that send ``X-Profile: sample|cprofile`` or ``?profile=1`` (or ``?profile=cprofile``).
+
+    Off unless ``config.profile_requests`` is set; other requests are served unprofiled.
+    """
+    from flask import request, g
+
+    @app.before_request
+    def _start_profile():
+        flag = request.headers.get("X-Profile") or request.args.get("profile")
+        if not flag or flag.lower() in ("0", "false", "no"):
+            return
+        if not _request_allowed(request.headers.get("X-Profile-Token", "")):
+            return
+        # Recognition runs on the job queue's workers, so sample them alongside the request thread
+        workers = [t.ident for t in threading.enumerate() if t.name.startswith("recognition-")]
+        g.profiler = start("cprofile" if flag.lower() == "cprofile" else "sample",
+                           [threading.get_ident()] + workers)
+
+    @app.after_request
+    def _finish_profile(response):
+        profiler = g.pop("profiler", None)
+        if profiler is not None:
+            path = finish(profiler, request.endpoint or "request")
+            response.headers["X-Profile-File"] = os.path.basename(path)
+        return response
@@ -1,87 +1,257 @@
 import os
 import pickle
+import time
+import queue
+import threading
+import itertools
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import cv2
 import numpy as np
 import dlib
 from datetime import datetime
 from settings import config
+from metrics import metrics
 from utils import download_and_extract
 from attendance import AttendanceRegister
-from crypto_utils import safe_temp_file
+
+FACE_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 20)
+
+
+def _iou(a, b):
+    """Overlap of two (left, top, right, bottom) boxes."""
+    l, t = max(a[0], b[0]), max(a[1], b[1])
+    r, btm = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, r - l) * max(0, btm - t)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union else 0.0
+
+
+class RecognitionSession:
+    """Recognition state of one camera/client: frame schedule, result cache and face tracks."""
+
+    def __init__(self, client_id):
+        self.client_id = client_id
+        self.frame_count = 0
+        self.last_results = []
+        self.tracks = {}  # track id -> {"location", "id", "name", "hits", "confirmed"}
+        self._track_ids = itertools.count(1)
+        self.last_seen = time.monotonic()
+        self.lock = threading.Lock()
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+    def due(self):
+        """Count a frame; True when this one should be recognized rather than reuse ``last_results``."""
+        self.touch()
+        self.frame_count += 1
+        return self.frame_count % config.process_every_n_frames == 0
+
+    def update_tracks(self, results):
+        """Match this frame's faces to the previous frame's tracks by overlap.
+
+        Returns the events it produced: ``track`` for a new face, ``identity``
+        once a track matched the same student on ``stream_confirm_frames``
+        consecutive frames.
+        """
+        self.touch()
+        events, tracks = [], {}
+        previous = dict(self.tracks)
+        for res in results:
+            best = max(previous.items(), key=lambda kv: _iou(kv[1]["location"], res["location"]), default=None)
+            if best and _iou(best[1]["location"], res["location"]) >= config.stream_track_iou:
+                track_id, track = best
+                del previous[track_id]
+                same = res["id"] is not None and res["id"] == track["id"]
+                track = {**track, "location": res["location"],
+                         "hits": track["hits"] + 1 if same else 1, "id": res["id"], "name": res["name"]}
+            else:
+                track_id = next(self._track_ids)
+                track = {"location": res["location"], "id": res["id"], "name": res["name"],
+                         "hits": 1, "confirmed": False}
+                events.append({"type": "track", "track": track_id, "location": list(res["location"])})
+            if res["id"] is not None and not track["confirmed"] and track["hits"] >= config.stream_confirm_frames:
+                track["confirmed"] = True
+                events.append({"type": "identity", "track": track_id, "id": res["id"], "name": res["name"],
+                               "confidence": round(float(res["confidence"]), 4)})
+            tracks[track_id] = track
+        self.tracks = tracks
+        self.last_results = results
+        return events
+
+    def idle_for(self):
+        return time.monotonic() - self.last_seen
+
+
+class Gallery:
+    """Immutable snapshot of the enrolled faces.
+
+    Changes build a new ``Gallery`` and publish it with a single assignment, so
+    a reader that takes ``self._gallery`` once per call always sees encodings,
+    names and ids of the same generation, without holding a lock.
+    """
+
+    def __init__(self, encodings=(), names=(), ids=(), unique_ids=(), twins_pairs=()):
+        self.encodings = tuple(encodings)
+        self.names = tuple(names)
+        self.ids = tuple(ids)
+        unique_ids = list(unique_ids)[:len(self.ids)]
+        self.unique_ids = tuple(unique_ids + [None] * (len(self.ids) - len(unique_ids)))  # optional, to disambiguate twins
+        self.twins_pairs = frozenset(map(frozenset, twins_pairs))  # frozenset({id1, id2}) pairs
+        self.matrix = np.array(self.encodings) if self.encodings else None
+
+    def __len__(self):
+        return len(self.encodings)
+
 
 class FaceRecognitionSystem:
     def __init__(self):
+        self._load_models()
+        self._gallery = Gallery()
+        self._gallery_lock = threading.RLock()  # Serializes writers only; readers use the published snapshot
+        self._load_encodings()
+        self._init_attendance()
+
+    def _load_models(self):
         self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        # Download dlib models if missing
-        download_and_extract(config.shape_predictor_url, config.shape_predictor_path)
-        download_and_extract(config.face_rec_model_url, config.face_rec_model_path)
+        # Download dlib models if missing; both at once on a fresh machine
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            list(pool.map(download_and_extract,
+                          [config.shape_predictor_url, config.face_rec_model_url],
+                          [config.shape_predictor_path, config.face_rec_model_path]))
         self.shape_predictor = dlib.shape_predictor(config.shape_predictor_path)
         self.face_rec_model = dlib.face_recognition_model_v1(config.face_rec_model_path)
+        # Model copies are lent to one call at a time; extra copies load on first contention
+        self.model_pool_size = config.model_pool_size
+        self._model_pool = queue.Queue()
+        self._model_pool.put((self.face_cascade, self.shape_predictor, self.face_rec_model))
+        self._models_created = 1
+        self._model_pool_lock = threading.Lock()
 
-        self.known_face_encodings, self.known_face_names, self.known_face_ids = [], [], []
-        self.known_face_unique_ids = []  # optional unique identifiers to disambiguate twins
-        self.twins_pairs = set()  # set of frozenset({id1, id2}) pairs
-        self._load_encodings()
-
-        self.attendance_marked = set()
-        self.today_date = datetime.now().date()
+    def _init_attendance(self):
         self.register = AttendanceRegister()
-        self.frame_count = 0
-        self.last_results = []
+        # Dedupe index seeded from today's register so a restart does not re-mark everyone in view
+        self.today_date = self.register.today
+        self.attendance_marked = self.register.marked_today()
+        self._marked_version = self.register.writer.version()
+        self.register.writer.subscribe(self._on_register_change)
+        self.sessions = {}
+        self._sessions_lock = threading.Lock()
 
     def _load_encodings(self):
         if os.path.exists(config.encodings_file): 
-            from crypto_utils import load_key, decrypt_file 
-            key = load_key("secret.key")
-            tmp_path = safe_temp_file()
-            try:
-                # Step 1: decrypt into a temp file
-                decrypt_file("face_encodings.pickle.enc", key, dst_path=tmp_path)
-                # Step 2: load from decrypted temp
-                with open(tmp_path, "rb") as f:
-                    encodings = pickle.load(f)
-                data = encodings
-                self.known_face_encodings = data.get('encodings', [])
-                self.known_face_names = data.get('names', [])
-                self.known_face_ids = data.get('ids', [])
-                self.known_face_unique_ids = data.get('unique_ids', [None] * len(self.known_face_ids))
-                self.twins_pairs = set(map(frozenset, data.get('twins_pairs', [])))
-            finally:
-                if os.path.exists(tmp_path):
-                    os.remove(tmp_path)
-
-    def _save_encodings(self):
-        data = {'encodings': self.known_face_encodings,
-                'names': self.known_face_names,
-                'ids': self.known_face_ids,
-                'unique_ids': self.known_face_unique_ids,
-                'twins_pairs': [list(p) for p in self.twins_pairs]}
-        from crypto_utils import load_key, encrypt_file
-
-        # Step 1: save temporarily
-        tmp_path = safe_temp_file()
-        try:
-            with open(tmp_path, "wb") as f:
-                pickle.dump(data, f)
+            from crypto_utils import load_keys, decrypt_to_buffer
+            # Full keyring so encodings stay readable while a key rotation is running
+            key = load_keys("secret.key")
+            # Decrypt and unpickle straight from memory; no plaintext touches disk.
+            # Strict: unpickling a file that failed authentication would run arbitrary code
+            buf = decrypt_to_buffer("face_encodings.pickle.enc", key, strict=True)
+            if buf is None:
+                return
+            data = pickle.load(buf)
+            self._gallery = Gallery(data.get('encodings', []), data.get('names', []), data.get('ids', []),
+                                    data.get('unique_ids', []), data.get('twins_pairs', []))
 
-            # Step 2: encrypt and save as .enc
-            key = load_key("secret.key")
-            encrypt_file(tmp_path, key, dst_path="face_encodings.pickle.enc")
-        finally:
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
+    def reload_encodings(self):
+        """Re-read the gallery from disk, e.g. after the GUI enrolled a student."""
+        with self._gallery_lock:
+            self._load_encodings()
+        print(f"[INFO] Reloaded {len(self._gallery)} face encodings")
+
+    # Read-only views of the current snapshot
+    @property
+    def known_face_encodings(self):
+        return self._gallery.encodings
+
+    @property
+    def known_face_names(self):
+        return self._gallery.names
+
+    @property
+    def known_face_ids(self):
+        return self._gallery.ids
+
+    @property
+    def known_face_unique_ids(self):
+        return self._gallery.unique_ids
 
+    @property
+    def twins_pairs(self):
+        return self._gallery.twins_pairs
+
+    def _publish_gallery(self, gallery):
+        """Swap in a new snapshot and save it."""
+        self._gallery = gallery
+        self._save_encodings(gallery)
+
+    def _save_encodings(self, gallery=None):
+        gallery = gallery or self._gallery
+        data = {'encodings': list(gallery.encodings),
+                'names': list(gallery.names),
+                'ids': list(gallery.ids),
+                'unique_ids': list(gallery.unique_ids),
+                'twins_pairs': [list(p) for p in gallery.twins_pairs]}
+        from crypto_utils import load_key, encrypt_from_buffer
+
+        key = load_key("secret.key")
+        encrypt_from_buffer(pickle.dumps(data), key, "face_encodings.pickle.enc")
+
+
+    # ---------------- Model Pool ----------------
+    @staticmethod
+    def new_models():
+        return (
+            cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'),
+            dlib.shape_predictor(config.shape_predictor_path),
+            dlib.face_recognition_model_v1(config.face_rec_model_path),
+        )
+
+    @contextmanager
+    def _models(self):
+        """Borrow a copy of the models for one call.
+
+        The cascade and dlib networks keep scratch state per call, so concurrent
+        callers need separate copies. Every thread in the process shares at most
+        ``model_pool_size`` of them (~130 MB each); further callers wait.
+        """
+        try:
+            models = self._model_pool.get_nowait()
+        except queue.Empty:
+            with self._model_pool_lock:
+                grow = self._models_created < self.model_pool_size
+                self._models_created += grow
+            if grow:
+                try:
+                    models = self.new_models()
+                except Exception:
+                    with self._model_pool_lock:
+                        self._models_created -= 1
+                    raise
+            else:
+                models = self._model_pool.get()
+        try:
+            yield models
+        finally:
+            self._model_pool.put(models)
 
     def detect_and_encode(self, frame):
         """Detect faces and encode them for recognition."""
-        small = cv2.resize(frame, (0, 0), fx=config.display_scale, fy=config.display_scale)
-        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
-        faces = self.face_cascade.detectMultiScale(
-            gray, 
-            scaleFactor=1.1,  # Reduced for better performance
-            minNeighbors=5, 
-            minSize=(50, 50)  # Smaller minimum size for better performance
-        )
+        with self._models() as models:
+            return self._detect_and_encode(frame, *models)
+
+    def _detect_and_encode(self, frame, face_cascade, shape_predictor, face_rec_model):
+        metrics.inc("frames_processed_total")
+        with metrics.timed("recognition_stage_seconds", stage="detect"):
+            small = cv2.resize(frame, (0, 0), fx=config.display_scale, fy=config.display_scale)
+            gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+            faces = face_cascade.detectMultiScale(
+                gray, 
+                scaleFactor=1.1,  # Reduced for better performance
+                minNeighbors=5, 
+                minSize=(50, 50)  # Smaller minimum size for better performance
+            )
+        metrics.observe("faces_per_frame", len(faces), buckets=FACE_COUNT_BUCKETS)
         results = []
         for (x, y, w, h) in faces:
             # Scale back to original frame coordinates
@@ -97,82 +267,171 @@ class FaceRecognitionSystem:
                 
             try:
                 dlib_rect = dlib.rectangle(0, 0, face_rgb.shape[1], face_rgb.shape[0])
-                shape = self.shape_predictor(face_rgb, dlib_rect)
-                encoding = np.array(self.face_rec_model.compute_face_descriptor(face_rgb, shape))
+                with metrics.timed("recognition_stage_seconds", stage="landmarks"):
+                    shape = shape_predictor(face_rgb, dlib_rect)
+                with metrics.timed("recognition_stage_seconds", stage="descriptor"):
+                    encoding = np.array(face_rec_model.compute_face_descriptor(face_rgb, shape))
                 results.append({'location': (l, t, r, b), 'encoding': encoding})
             except Exception:
                 continue
         return results
 
     def compare_faces(self, encoding):
-        if not self.known_face_encodings:
+        gallery = self._gallery
+        if not gallery.encodings:
             return None, 'Unknown', 0.0
-        encodings = np.array(self.known_face_encodings)
-        distances = np.linalg.norm(encodings - encoding, axis=1)
+        distances = np.linalg.norm(gallery.matrix - encoding, axis=1)
         min_index = np.argmin(distances)
         min_distance = distances[min_index]
         if min_distance < config.face_match_threshold:
-            return (self.known_face_ids[min_index], self.known_face_names[min_index], 1 - min_distance)
+            return (gallery.ids[min_index], gallery.names[min_index], 1 - min_distance)
         return None, 'Unknown', 0.0
 
+    def compare_faces_batch(self, encodings):
+        """``compare_faces`` for many encodings at once: one distance matrix against the gallery."""
+        gallery = self._gallery
+        if not gallery.encodings or len(encodings) == 0:
+            return [(None, 'Unknown', 0.0)] * len(encodings)
+        with metrics.timed("recognition_stage_seconds", stage="match"):
+            known = gallery.matrix
+            distances = np.linalg.norm(np.asarray(encodings)[:, None, :] - known[None, :, :], axis=2)
+            best = distances.argmin(axis=1)
+            best_distances = distances[np.arange(len(best)), best]
+        return [(gallery.ids[i], gallery.names[i], 1 - d) if d < config.face_match_threshold
+                else (None, 'Unknown', 0.0)
+                for i, d in zip(best.tolist(), best_distances.tolist())]
+
     def find_potential_twin_conflict(self, collected_encoding):
-        if not self.known_face_encodings:
+        gallery = self._gallery
+        if not gallery.encodings:
             return None, None
-        encodings = np.array(self.known_face_encodings)
-        distances = np.linalg.norm(encodings - collected_encoding, axis=1)
+        distances = np.linalg.norm(gallery.matrix - collected_encoding, axis=1)
         min_index = int(np.argmin(distances))
         min_distance = float(distances[min_index])
         if min_distance < getattr(config, 'twin_match_threshold', 0.28):
             return {
                 'index': min_index,
-                'student_id': self.known_face_ids[min_index],
-                'name': self.known_face_names[min_index],
-                'unique_id': self.known_face_unique_ids[min_index] if self.known_face_unique_ids else None,
+                'student_id': gallery.ids[min_index],
+                'name': gallery.names[min_index],
+                'unique_id': gallery.unique_ids[min_index],
                 'distance': min_distance
             }, min_distance
         return None, min_distance
 
     def replace_student_encodings(self, target_student_id, new_encodings, new_name=None, new_unique_id=None):
-        # Remove all existing encodings for the student, then append new ones
-        indices_to_keep = [i for i, sid in enumerate(self.known_face_ids) if sid != target_student_id]
-        self.known_face_encodings = [self.known_face_encodings[i] for i in indices_to_keep]
-        self.known_face_names = [self.known_face_names[i] for i in indices_to_keep]
-        self.known_face_ids = [self.known_face_ids[i] for i in indices_to_keep]
-        if self.known_face_unique_ids:
-            self.known_face_unique_ids = [self.known_face_unique_ids[i] for i in indices_to_keep]
-        for enc in new_encodings:
-            self.known_face_encodings.append(enc)
-            self.known_face_names.append(new_name)
-            self.known_face_ids.append(target_student_id)
-            if not self.known_face_unique_ids:
-                self.known_face_unique_ids = [None] * (len(self.known_face_encodings) - 1)
-            self.known_face_unique_ids.append(new_unique_id)
-        self._save_encodings()
-
-    def detect_and_recognize_faces(self, frame):
-        self.frame_count += 1
-        if self.frame_count % config.process_every_n_frames != 0:
-            return self.last_results
-        faces = self.detect_and_encode(frame)
-        results = []
-        for face in faces:
-            sid, name, confidence = self.compare_faces(face['encoding'])
-            results.append({'location': face['location'], 'name': name, 'id': sid, 'confidence': confidence})
-        self.last_results = results
+        with self._gallery_lock:
+            old = self._gallery
+            # Remove all existing encodings for the student, then append new ones
+            keep = [i for i, sid in enumerate(old.ids) if sid != target_student_id]
+            count = len(new_encodings)
+            self._publish_gallery(Gallery(
+                [old.encodings[i] for i in keep] + list(new_encodings),
+                [old.names[i] for i in keep] + [new_name] * count,
+                [old.ids[i] for i in keep] + [target_student_id] * count,
+                [old.unique_ids[i] for i in keep] + [new_unique_id] * count,
+                old.twins_pairs))
+
+    def add_student_encodings(self, sid, name, new_encodings, unique_id=None):
+        """Append a newly enrolled student's encodings to the gallery and save it."""
+        with self._gallery_lock:
+            old = self._gallery
+            count = len(new_encodings)
+            self._publish_gallery(Gallery(
+                old.encodings + tuple(new_encodings), old.names + (name,) * count,
+                old.ids + (sid,) * count, old.unique_ids + (unique_id,) * count, old.twins_pairs))
+
+    def clear_gallery(self):
+        with self._gallery_lock:
+            self._publish_gallery(Gallery())
+
+    # ---------------- Marked-Today Index ----------------
+    def _on_register_change(self, event):
+        """Keep the dedupe index in sync with marks from any source in this process."""
+        if event["type"] in ("reset", "rollover"):
+            self.attendance_marked = set()
+            if event["type"] == "rollover":
+                self.today_date = datetime.fromisoformat(event["date"]).date()
+        elif event["type"] == "marks" and event["date"] == self.today_date.isoformat():
+            for sid, status in event["changes"].items():
+                if status == "P":
+                    self.attendance_marked.add(sid)
+                else:
+                    self.attendance_marked.discard(sid)
+        self._marked_version = event.get("version", self._marked_version)
+
+    def _roll_over_if_needed(self):
+        today = datetime.now().date()
+        if today != self.today_date:
+            self.register.refresh_date()
+            self.attendance_marked = set()
+            self.today_date = today
+            self._marked_version = None
+
+    def _sync_marked_index(self):
+        """Roll over at midnight and pick up marks written by other processes."""
+        self._roll_over_if_needed()
+        version = self.register.writer.version()
+        if version != self._marked_version:
+            self.attendance_marked = self.register.marked_today()
+            self._marked_version = version
+
+    # ---------------- Sessions ----------------
+    def session(self, client_id="local"):
+        """The session for a camera/client, created on first use; idle sessions are evicted."""
+        with self._sessions_lock:
+            for cid in [c for c, s in self.sessions.items() if s.idle_for() > config.session_idle_seconds]:
+                del self.sessions[cid]
+            session = self.sessions.get(client_id)
+            if session is None:
+                session = self.sessions[client_id] = RecognitionSession(client_id)
+            session.touch()
+            return session
+
+    def end_session(self, client_id):
+        with self._sessions_lock:
+            self.sessions.pop(client_id, None)
+
+    def detect_and_recognize_faces(self, frame, client_id="local"):
+        """Recognize every ``process_every_n_frames``-th frame of a client; in between reuse its last results."""
+        self._roll_over_if_needed()
+        session = self.session(client_id)
+        with session.lock:
+            if not session.due():
+                metrics.inc("frames_skipped_total")
+                return session.last_results
+        results = self.recognize_frames([frame])
+        for res in results:
+            del res['frame']
+        with session.lock:
+            session.update_tracks(results)
+        return results
+
+    def recognize_frames(self, frames):
+        """Detect and identify faces in a batch of frames (every frame is processed, none skipped)."""
+        self._roll_over_if_needed()
+        faces = [(i, face) for i, frame in enumerate(frames) for face in self.detect_and_encode(frame)]
+        matches = self.compare_faces_batch([face['encoding'] for _, face in faces])
+        results = [{'frame': i, 'location': face['location'], 'name': name, 'id': sid, 'confidence': confidence}
+                   for (i, face), (sid, name, confidence) in zip(faces, matches)]
+        self._count_matches(results)
         return results
 
+    @staticmethod
+    def _count_matches(results):
+        matched = sum(1 for res in results if res['id'] is not None)
+        metrics.inc("faces_matched_total", matched)
+        metrics.inc("faces_unknown_total", len(results) - matched)
+
     def mark_attendance(self, sid, name):
         if sid is None or name == 'Unknown':
             return
-        today = datetime.now().date()
-        if today != self.today_date:
-            self.attendance_marked.clear()
-            self.today_date = today
+        self._sync_marked_index()
         if sid not in self.attendance_marked:
             try:
-                # Unified attendance method; marks 'P' by default
-                self.register.mark_attendance(sid, name, "P")
+                # Unified attendance method; marks 'P' by default and skips no-op writes
+                written = self.register.mark_attendance(sid, name, "P")
                 self.attendance_marked.add(sid)
-                print(f"[SUCCESS] Marked attendance for {name} (ID: {sid})")
+                if written:
+                    print(f"[SUCCESS] Marked attendance for {name} (ID: {sid})")
             except Exception as e:
                 print(f"[ERROR] Error marking attendance for {name}: {e}")
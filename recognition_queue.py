@@ -0,0 +1,164 @@
+"""
+Bounded job queue in front of the face recognizer.
+
+Recognition requests become jobs on a queue of fixed depth served by a fixed
+pool of worker threads, so a burst of devices waits its turn instead of
+running every detection at once. When the queue is full, ``submit`` raises
+``QueueFullError`` with a suggested retry delay instead of accepting more work.
+Each job records how long it waited and how long it ran.
+"""
+
+import math
+import time
+import uuid
+import queue
+import threading
+from collections import deque
+
+
+class QueueFullError(Exception):
+    """Raised when the recognition queue is at its configured depth."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Recognition queue is full; retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class RecognitionJob:
+    def __init__(self, args):
+        self.id = uuid.uuid4().hex
+        self.args = args
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+    def wait(self, timeout):
+        return self.done.wait(timeout)
+
+    def to_dict(self):
+        data = {"job_id": self.id, "status": self.status}
+        if self.started_at is not None:
+            data["queue_wait_ms"] = round((self.started_at - self.enqueued_at) * 1000, 1)
+        if self.finished_at is not None:
+            data["processing_ms"] = round((self.finished_at - self.started_at) * 1000, 1)
+        if self.status == "done":
+            data["result"] = self.result
+        elif self.status == "failed":
+            data["error"] = self.error
+        return data
+
+
+class RecognitionQueue:
+    def __init__(self, handler, workers=2, depth=32, job_ttl=300):
+        """``handler(*job.args)`` runs on a worker thread."""
+        self.handler = handler
+        self.workers = workers
+        self.depth = depth
+        self.job_ttl = job_ttl
+        self._queue = queue.Queue(maxsize=depth)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._running = 0
+        self._waits = deque(maxlen=500)
+        self._runs = deque(maxlen=500)
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._threads = []
+
+    def _ensure_workers(self):
+        """Start the pool on first use (and again in a forked worker process, where threads do not survive)."""
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for i in range(len(self._threads), self.workers):
+                t = threading.Thread(target=self._worker, name=f"recognition-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    # ---------------- Submission ----------------
+    def retry_after(self):
+        """Seconds until a slot is likely to free up, from recent processing times."""
+        with self._lock:
+            avg = sum(self._runs) / len(self._runs) if self._runs else 1.0
+        return max(1, math.ceil(self._queue.qsize() * avg / max(1, self.workers)))
+
+    def submit(self, *args):
+        self._ensure_workers()
+        self._prune()
+        job = RecognitionJob(args)
+        # Register before queueing: a worker may finish the job before put_nowait returns
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+                self.rejected += 1
+            raise QueueFullError(self.retry_after())
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        cutoff = time.monotonic() - self.job_ttl
+        with self._lock:
+            for job_id in [j.id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+                del self._jobs[job_id]
+
+    # ---------------- Workers ----------------
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            job.started_at = time.monotonic()
+            job.status = "running"
+            with self._lock:
+                self._running += 1
+            try:
+                job.result = self.handler(*job.args)
+                job.status = "done"
+            except Exception as e:
+                job.error = str(e)
+                job.status = "failed"
+                print(f"[ERROR] Recognition job {job.id} failed: {e}")
+            job.finished_at = time.monotonic()
+            with self._lock:
+                self._running -= 1
+                self._waits.append(job.started_at - job.enqueued_at)
+                self._runs.append(job.finished_at - job.started_at)
+                if job.status == "done":
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            job.args = None  # Frames are not needed once the job has run
+            job.done.set()
+
+    # ---------------- Metrics ----------------
+    @staticmethod
+    def _summary(samples):
+        if not samples:
+            return {"avg_ms": 0.0, "p95_ms": 0.0, "max_ms": 0.0}
+        ordered = sorted(samples)
+        p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+        return {"avg_ms": round(sum(ordered) / len(ordered) * 1000, 1),
+                "p95_ms": round(p95 * 1000, 1), "max_ms": round(ordered[-1] * 1000, 1)}
+
+    def status(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "depth": self.depth,
+                "queued": self._queue.qsize(),
+                "running": self._running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "queue_wait": self._summary(self._waits),
+                "processing": self._summary(self._runs),
+            }
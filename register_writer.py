@@ -0,0 +1,222 @@
+"""
+Single-writer coordination for the attendance registers.
+
+Every mutation of the workbooks in a data directory goes through one queue
+and one writer thread per process. Across processes (GUI kiosk, web server,
+CLI) the writer also holds an OS advisory lock on ``<data_dir>/.register.lock``
+while it writes, so a second process waits briefly for its turn instead of
+interleaving with the first. Readers take the same lock in shared mode to get
+a consistent snapshot across files, and a version counter stored next to the
+lock tells every process when its cached snapshots are stale.
+"""
+
+import os
+import time
+import queue
+import threading
+import functools
+from concurrent.futures import Future
+from contextlib import contextmanager
+from pathlib import Path
+from metrics import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class WriterBusyError(TimeoutError):
+    """Raised when another process holds the register lock for too long."""
+
+
+class RegisterWriter:
+    def __init__(self, data_dir, lock_timeout=10.0):
+        self.data_dir = data_dir
+        self.lock_timeout = lock_timeout
+        self.lock_path = os.path.join(data_dir, ".register.lock")
+        self.version_path = os.path.join(data_dir, ".register.version")
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._listeners = []
+        self._events = []
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        """A forked child has no writer thread; it starts its own on the first write."""
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._events = []
+
+    # ---------------- OS Advisory Lock ----------------
+    @contextmanager
+    def _os_lock(self, exclusive=True):
+        """Hold the advisory lock, retrying until ``lock_timeout`` expires."""
+        os.makedirs(self.data_dir, exist_ok=True)
+        fh = open(self.lock_path, "a+b")
+        deadline = time.monotonic() + self.lock_timeout
+        delay = 0.005
+        try:
+            while True:
+                try:
+                    if fcntl is not None:
+                        mode = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+                        fcntl.flock(fh.fileno(), mode | fcntl.LOCK_NB)
+                    else:
+                        # msvcrt only offers exclusive byte-range locks
+                        fh.seek(0)
+                        msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    if time.monotonic() >= deadline:
+                        raise WriterBusyError(f"register lock {self.lock_path} busy for {self.lock_timeout}s")
+                    time.sleep(delay)
+                    delay = min(delay * 2, 0.1)
+            yield
+        finally:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+                else:
+                    fh.seek(0)
+                    msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+            except OSError:
+                pass
+            fh.close()
+
+    @contextmanager
+    def snapshot(self):
+        """Shared lock for readers: no writer can change the files while it is held."""
+        if self.in_writer_thread():
+            yield
+            return
+        with self._os_lock(exclusive=False):
+            yield
+
+    # ---------------- Version Counter ----------------
+    def version(self):
+        """Number of committed mutations in this data directory, across all processes."""
+        try:
+            return int(Path(self.version_path).read_text() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _bump_version(self):
+        version = self.version() + 1
+        tmp = f"{self.version_path}.{os.getpid()}.tmp"
+        Path(tmp).write_text(str(version))
+        os.replace(tmp, self.version_path)
+        return version
+
+    # ---------------- Change Notifications ----------------
+    def subscribe(self, callback):
+        """Call ``callback(event)`` after every committed change published in this process."""
+        self._listeners.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def publish(self, event):
+        """Announce a change; inside a mutation it is delivered once the write commits."""
+        if self.in_writer_thread():
+            self._events.append(event)
+        else:
+            self._dispatch([event], self.version())
+
+    def _dispatch(self, events, version):
+        for event in events:
+            event["version"] = version
+            for callback in list(self._listeners):
+                try:
+                    callback(event)
+                except Exception as e:
+                    print(f"[ERROR] Register listener failed: {e}")
+
+    # ---------------- Write Queue ----------------
+    def in_writer_thread(self):
+        return threading.current_thread() is self._thread
+
+    def _ensure_thread(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="register-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue a mutation; returns a Future with its result."""
+        future = Future()
+        self._ensure_thread()
+        self._queue.put((future, fn, args, kwargs))
+        return future
+
+    def run(self, fn, *args, **kwargs):
+        """Run a mutation through the writer and wait for it.
+
+        Calls made from inside a running mutation execute inline so nested
+        register methods do not deadlock on their own queue.
+        """
+        if self.in_writer_thread():
+            return fn(*args, **kwargs)
+        return self.submit(fn, *args, **kwargs).result()
+
+    def drain(self):
+        """Wait until every queued mutation has committed."""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            future, fn, args, kwargs = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                self._queue.task_done()
+                continue
+            events, self._events = [], []
+            try:
+                with self._os_lock(exclusive=True), metrics.timed("register_write_seconds"):
+                    try:
+                        result = fn(*args, **kwargs)
+                        events = self._events
+                    finally:
+                        self._events = []
+                        version = self._bump_version()
+                # Listeners track the version; a silent write still tells them it was local
+                self._dispatch(events or [{"type": "write"}], version)
+                future.set_result(result)
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(data_dir):
+    """The shared writer for ``data_dir`` in this process."""
+    key = os.path.abspath(data_dir)
+    with _writers_lock:
+        if key not in _writers:
+            _writers[key] = RegisterWriter(data_dir)
+        return _writers[key]
+
+
+def drain_writers():
+    """Wait for every writer in this process to go idle, e.g. before forking."""
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        writer.drain()
+
+
+def serialized_write(method):
+    """Decorator for AttendanceRegister methods that mutate the workbooks."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return self.writer.run(method, self, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,182 @@
+"""
+Production entry point for the Smart Attendance server.
+
+The dlib models, the face gallery and the registers are loaded once in the
+parent process, which then forks worker processes that all accept on one
+shared listening socket. Workers share the preloaded memory copy-on-write.
+Before forking, the parent lets its register writer, backup and key rotation
+threads finish their work so none of them holds a lock at the fork; each
+worker starts its own background threads on first use.
+When the model server (model_server.py) is running, the parent loads no
+models at all: every worker is a thin client of the one model server.
+Register writes from every worker are serialized by the register writer's
+lock on the data directory, and each worker's caches follow its version
+counter, so workers never disagree about attendance.
+
+Signals (POSIX):
+- SIGHUP reloads the face gallery in every worker without closing the socket
+- SIGTERM / SIGINT stop the workers and exit
+
+On platforms without ``os.fork`` (Windows) it serves from one threaded process.
+Metrics (/metrics) are per worker and labelled with its ``pid``; a scrape sees
+whichever worker answered, so sum across ``pid`` in the monitoring query.
+
+Streaming sessions (/stream/...) live in the worker that accepted them, so a
+camera's frame upload and event stream must reach the same worker; run with
+``--workers 1`` (or sticky routing in front) when cameras stream.
+
+Usage: python serve.py [--workers N] [--host HOST] [--port PORT] [--https]
+"""
+
+import os
+import gc
+import sys
+import signal
+import socket
+import argparse
+import threading
+from werkzeug.serving import make_server
+from settings import config
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Smart Attendance production server")
+    parser.add_argument("--workers", type=int, default=config.server_workers or os.cpu_count() or 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=config.server_port)
+    parser.add_argument("--https", action="store_true", help="serve TLS with ssl_certs/server.crt")
+    return parser.parse_args()
+
+
+def listen(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+    return sock
+
+
+# ---------------- Worker ----------------
+def run_worker(app, face_system, sock, ssl_context):
+    host, port = sock.getsockname()[:2]
+    server = make_server(host, port, app, threaded=True, ssl_context=ssl_context, fd=sock.fileno())
+
+    def reload_gallery(signum, frame):
+        # Load off the signal handler; requests keep using the old gallery until it is swapped in
+        threading.Thread(target=face_system.reload_encodings, name="gallery-reload", daemon=True).start()
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGHUP, reload_gallery)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The parent handles Ctrl+C for the whole group
+    print(f"[INFO] Worker {os.getpid()} serving")
+    server.serve_forever()
+
+
+def spawn(app, face_system, sock, ssl_context):
+    pid = os.fork()
+    if pid == 0:
+        from crypto_utils import backup_scheduler
+        code = 0
+        try:
+            run_worker(app, face_system, sock, ssl_context)
+            backup_scheduler.flush()
+        except Exception as e:
+            print(f"[ERROR] Worker {os.getpid()} failed: {e}")
+            code = 1
+        finally:
+            # Never fall back into the supervisor loop inherited from the parent
+            os._exit(code)
+    return pid
+
+
+# ---------------- Supervisor ----------------
+def quiesce():
+    """Let the parent's background threads go idle before forking.
+
+    Threads do not survive a fork, and a lock one of them holds at that moment
+    stays held forever in the child.
+    """
+    from crypto_utils import backup_scheduler
+    from register_writer import drain_writers
+    from server import key_rotation
+
+    if key_rotation.is_running():
+        print("[INFO] Finishing the interrupted key rotation before starting workers")
+        key_rotation.wait()
+    drain_writers()
+    # Anything queued before the fork would otherwise be written once per worker
+    backup_scheduler.flush()
+
+
+def supervise(app, face_system, sock, ssl_context, workers):
+    quiesce()
+    # Move the preloaded models out of the collector's generations so its
+    # bookkeeping does not touch (and un-share) their pages in every worker
+    gc.collect()
+    gc.freeze()
+
+    children = {spawn(app, face_system, sock, ssl_context) for _ in range(workers)}
+    stopping = False
+
+    def forward(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        forward(signal.SIGTERM, frame)
+
+    signal.signal(signal.SIGHUP, forward)
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    print(f"[INFO] Serving with {workers} workers (pid {os.getpid()}); SIGHUP reloads the gallery")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            print(f"[ERROR] Worker {pid} exited with status {status}; restarting")
+            children.add(spawn(app, face_system, sock, ssl_context))
+    print("[INFO] All workers stopped")
+
+
+def main():
+    args = parse_args()
+    ssl_context = None
+    if args.https:
+        from server_https import create_ssl_context
+        ssl_context = create_ssl_context()
+        if ssl_context is None:
+            print("[ERROR] HTTPS requested but certificates could not be loaded")
+            sys.exit(1)
+
+    # Importing the app loads the models, gallery and registers once, before any fork
+    from server import app, face_system
+
+    scheme = "https" if ssl_context else "http"
+    print(f"[INFO] Listening on {scheme}://{args.host}:{args.port}")
+    if not hasattr(os, "fork") or args.workers <= 1:
+        if not hasattr(os, "fork"):
+            print("[INFO] os.fork is not available; serving from one threaded process")
+        make_server(args.host, args.port, app, threaded=True, ssl_context=ssl_context).serve_forever()
+        return
+
+    sock = listen(args.host, args.port)
+    supervise(app, face_system, sock, ssl_context, args.workers)
+
+
+if __name__ == "__main__":
+    main()
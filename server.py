@@ -1,20 +1,73 @@
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, jsonify, request, send_from_directory, stream_with_context
 from flask_cors import CORS
 from attendance import AttendanceRegister
-from recognition import FaceRecognitionSystem
+from model_server import create_face_system
 import cv2
 import numpy as np
-from datetime import datetime
 from settings import config
-from crypto_utils import load_key, delete_key, generate_key
+from crypto_utils import load_key, backup_scheduler
+from key_rotation import KeyRotation
+from analytics import AttendanceAnalytics
+from http_cache import ResponseCache
+from streaming import StreamHub
+from recognition_queue import RecognitionQueue, QueueFullError
+from metrics import metrics
+import profiling
+import time
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=["X-Next-Cursor", "ETag"])
 
 # Initialize systems
 attendance = AttendanceRegister()
-face_system = FaceRecognitionSystem()
+face_system = create_face_system()
 SECRET_KEY = load_key()
+key_rotation = KeyRotation()
+key_rotation.resume_if_pending()
+analytics = AttendanceAnalytics(attendance)
+# Read responses are cached until the next register write
+http_cache = ResponseCache(attendance.writer, min_compress_bytes=config.compress_min_bytes)
+streams = StreamHub(face_system)
+
+def recognize_and_mark(frames, client_id=None):
+    """Recognition job: identify every face in the batch and mark each student once.
+
+    With a client id the frames also advance that camera's session (tracks and cached results).
+    """
+    results = face_system.recognize_frames(frames)
+    if client_id:
+        session = face_system.session(client_id)
+        with session.lock:
+            for i in range(len(frames)):
+                session.update_tracks([res for res in results if res['frame'] == i])
+    for sid, name in {res['id']: res['name'] for res in results if res['id'] is not None}.items():
+        face_system.mark_attendance(sid, name)
+    return results
+
+recognition_jobs = RecognitionQueue(recognize_and_mark,
+                                    workers=config.recognition_workers,
+                                    depth=config.recognition_queue_depth,
+                                    job_ttl=config.recognition_job_ttl)
+
+metrics.gauge("backup_lag_seconds", lambda: backup_scheduler.status()["lag_seconds"],
+              "Age of the oldest pending encrypted backup")
+metrics.gauge("backups_pending", lambda: backup_scheduler.status()["pending"], "Encrypted backups waiting to run")
+metrics.gauge("recognition_queue_depth", lambda: recognition_jobs.status()["queued"], "Recognition jobs waiting")
+metrics.gauge("recognition_sessions", lambda: len(face_system.sessions), "Active per-camera sessions")
+
+profiling.init_app(app)
+
+@app.before_request
+def start_timer():
+    request.started_at = time.perf_counter()
+
+@app.after_request
+def record_timing(response):
+    started = getattr(request, "started_at", None)
+    if started is not None and request.endpoint != "metrics_endpoint":
+        metrics.observe("http_request_seconds", time.perf_counter() - started,
+                        endpoint=request.endpoint or "unknown")
+    return response
 
 # ---------------- ROUTES ----------------
 @app.route("/", methods=["GET"])
@@ -34,44 +87,58 @@ def serve_website():
 @app.route("/init_attendance", methods=["GET"])
 def init_attendance():
     try:
-        attendance._ensure_register()
-        attendance._ensure_calendar()
-        attendance._ensure_yearly()
-        attendance._ensure_master()
+        attendance.ensure_registers()
         return jsonify({"success": True, "message": "Attendance system initialized"}), 200
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route("/get_attendance", methods=["GET"])
+@http_cache.cached
 def get_attendance():
+    """Master rows, optionally filtered by ``start``/``end``/``month``/``student_id`` and paginated.
+
+    Pass ``limit`` (or a ``cursor`` from the previous page's ``X-Next-Cursor``
+    header) to page through the history newest day first; without them every
+    matching row is returned, oldest first.
+    """
     try:
-        import pandas as pd
-        df_master = attendance._normalize_schemas()
-        df_master = pd.read_excel(attendance.master_file)
-        records = []
-        for _, row in df_master.iterrows():
-            records.append({
-                "StudentID": row["StudentID"],
-                "Name": row["Name"],
-                "Date": row["Date"],
-                "Status": row["Status"]
-            })
-        return jsonify(records), 200
+        args = request.args
+        start, end = args.get("start"), args.get("end")
+        month = args.get("month")
+        if month:
+            if len(month) <= 2:
+                month = f"{args.get('year', attendance.today.year)}-{int(month):02d}"
+            start = max(start, f"{month}-01") if start else f"{month}-01"
+            end = min(end, f"{month}-31") if end else f"{month}-31"
+        student_id = args.get("student_id", type=int)
+        cursor = args.get("cursor")
+        limit = args.get("limit", type=int)
+        if limit is not None or cursor:
+            limit = max(1, min(limit or config.attendance_page_size, config.attendance_page_size))
+        df, next_cursor = attendance.page_master(start, end, student_id, cursor, limit)
+        body = df[["StudentID", "Name", "Date", "Status"]].to_json(orient="records") if not df.empty else "[]"
+        response = app.response_class(body, status=200, mimetype="application/json")
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return response
+    except ValueError as e:
+        return jsonify({"success": False, "error": f"Invalid query: {e}"}), 400
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route("/update_attendance", methods=["POST"])
 def update_attendance():
     try:
-        data = request.get_json()
-        today_str = datetime.now().date().isoformat()
-        for record in data:
-            student_id = int(record["StudentID"])
-            name = record.get("Name", "Unknown")
-            status = record.get("Status", "P").strip().upper()
-            status = "P" if status == "P" else "A"
-            attendance.mark_attendance(student_id, name, status)
-        return jsonify({"success": True, "message": "Attendance updated"}), 200
+        data = request.get_json(silent=True)
+        if not isinstance(data, list):
+            return jsonify({"success": False, "error": "Expected a JSON list of records"}), 400
+        # Validation is per record in mark_attendance_bulk; one bad record rejects the batch with its errors
+        result = attendance.mark_attendance_bulk(data)
+        if not result["success"]:
+            return jsonify({"success": False, "error": "Invalid records, nothing saved",
+                            "results": result["results"]}), 400
+        return jsonify({"success": True, "message": "Attendance updated",
+                        "results": result["results"]}), 200
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -86,6 +153,21 @@ def add_student():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route("/add_students", methods=["POST"])
+def add_students():
+    try:
+        data = request.get_json()
+        if isinstance(data, dict):
+            data = data.get("students", [])
+        records = [(int(rec["StudentID"]), rec["Name"]) for rec in data]
+        result = attendance.add_students_bulk(records)
+        return jsonify({"success": True,
+                        "message": f"{len(result['added'])} students added",
+                        "added": result["added"],
+                        "skipped": result["skipped"]}), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
 @app.route("/reset_attendance", methods=["POST"])
 def reset_attendance():
     try:
@@ -94,41 +176,190 @@ def reset_attendance():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+def _request_frames():
+    """Encoded frames from a raw image body, a multipart upload, or base64 JSON (``image``/``images``)."""
+    if request.mimetype.startswith("image/") or request.mimetype == "application/octet-stream":
+        return [request.get_data()]
+    if request.files:
+        return [f.read() for key in request.files for f in request.files.getlist(key)]
+    import base64
+    data = request.get_json(silent=True) or {}
+    images = data.get("images") or ([data["image"]] if data.get("image") else [])
+    with metrics.timed("recognition_stage_seconds", stage="base64"):
+        return [base64.b64decode(img.split(",", 1)[-1]) for img in images]
+
+def _decode_frame(buf):
+    """JPEG/PNG bytes straight to a BGR array."""
+    if not buf:
+        raise ValueError("Empty image")
+    metrics.inc("upload_bytes_total", len(buf))
+    with metrics.timed("recognition_stage_seconds", stage="decode"):
+        frame = cv2.imdecode(np.frombuffer(buf, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError("Could not decode image")
+    return frame
+
+def _sync_timeout():
+    """Seconds to wait for the result: ``?timeout=`` capped at the configured maximum; 0 never waits."""
+    raw = request.args.get("timeout")
+    if raw is None:
+        return config.recognition_sync_timeout
+    try:
+        timeout = float(raw)
+    except ValueError:
+        raise ValueError("timeout must be a number of seconds")
+    if not 0 <= timeout < float("inf"):
+        raise ValueError("timeout must be zero or a positive number of seconds")
+    return min(timeout, config.recognition_sync_timeout)
+
 @app.route("/mark_face_attendance", methods=["POST"])
 def mark_face_attendance():
+    """Recognize faces in one or more frames and mark everyone identified.
+
+    Accepts a raw ``image/jpeg`` body, a multipart upload with one or more
+    files, or the original JSON ``{"image": <base64>}`` (``"images"`` for
+    several). Each result carries the index of the frame it came from.
+    An ``X-Client-ID`` header (or ``client_id``) keeps per-camera session state.
+    """
     try:
-        import base64
-        from io import BytesIO
-        from PIL import Image
+        try:
+            encoded = _request_frames()
+            if not encoded:
+                return jsonify({"success": False, "error": "No image provided"}), 400
+            if len(encoded) > config.max_frames_per_request:
+                return jsonify({"success": False,
+                                "error": f"At most {config.max_frames_per_request} frames per request"}), 413
+            frames = [_decode_frame(buf) for buf in encoded]
+            timeout = _sync_timeout()
+        except ValueError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
 
-        data = request.get_json()
-        img_b64 = data.get("image")
-        if not img_b64:
-            return jsonify({"success": False, "error": "No image provided"}), 400
+        try:
+            client_id = request.headers.get("X-Client-ID") or request.args.get("client_id")
+            job = recognition_jobs.submit(frames, client_id)
+        except QueueFullError as e:
+            response = jsonify({"success": False, "error": str(e), "retry_after": e.retry_after})
+            response.headers["Retry-After"] = str(e.retry_after)
+            return response, 429
 
-        img_bytes = base64.b64decode(img_b64)
-        img = Image.open(BytesIO(img_bytes))
-        frame = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+        if request.args.get("async", "").lower() in ("1", "true", "yes"):
+            return jsonify({"success": True, "job_id": job.id, "status": job.status}), 202
+        if not job.wait(timeout):
+            # Still queued or running: hand back the job id instead of holding the connection
+            return jsonify({"success": True, "job_id": job.id, "status": job.status}), 202
+        if job.status == "failed":
+            return jsonify({"success": False, "error": job.error, "job_id": job.id}), 500
+        return jsonify({"success": True, "frames": len(frames), "results": job.result, "job_id": job.id}), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
 
-        results = face_system.detect_and_recognize_faces(frame)
-        for res in results:
-            sid, name = res['id'], res['name']
-            face_system.mark_attendance(sid, name)
+@app.route("/recognition_jobs/<job_id>", methods=["GET"])
+def recognition_job(job_id):
+    job = recognition_jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Unknown or expired job"}), 404
+    return jsonify({"success": True, **job.to_dict()}), 200
 
-        return jsonify({"success": True, "results": results}), 200
+@app.route("/recognition_queue", methods=["GET"])
+def recognition_queue_status():
+    return jsonify({"success": True, **recognition_jobs.status()}), 200
+
+@app.route("/stats/summary", methods=["GET"])
+@http_cache.cached
+def stats_summary():
+    """Dashboard totals for today (or ``?date=YYYY-MM-DD``) from the materialized aggregates."""
+    try:
+        return jsonify({"success": True, **analytics.summary(request.args.get("date"))}), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route("/attendance/matrix", methods=["GET"])
+@http_cache.cached
+def attendance_matrix():
+    """Compact monthly view: one status string per student, one character per recorded day."""
+    try:
+        month = request.args.get("month", type=int) or attendance.today.month
+        year = request.args.get("year", type=int) or attendance.today.year
+        if not 1 <= month <= 12:
+            return jsonify({"success": False, "error": "month must be 1-12"}), 400
+        return jsonify({"success": True, **analytics.month_matrix(year, month)}), 200
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route("/stats/student/<int:student_id>", methods=["GET"])
+@http_cache.cached
+def student_stats(student_id):
+    """Monthly rates and streaks for one student, served from the materialized aggregates."""
+    try:
+        return jsonify({"success": True, **analytics.student(student_id)}), 200
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+# ---------------- STREAMING ----------------
+@app.route("/stream/<camera_id>/frames", methods=["POST"])
+def stream_frames(camera_id):
+    """Push frames for one camera: a chunked body of length-prefixed JPEGs, or a single image body."""
+    try:
+        stream = streams.get(camera_id)
+        if request.mimetype.startswith("image/"):
+            stream.push(request.get_data())
+            pushed = 1
+        else:
+            pushed = 0
+            for buf in StreamHub.read_frames(request.stream):
+                stream.push(buf)
+                pushed += 1
+        return jsonify({"success": True, "pushed": pushed, **stream.status()}), 200
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route("/stream/<camera_id>/events", methods=["GET"])
+def stream_events(camera_id):
+    """Server-sent events for one camera: track, identity and marked."""
+    stream = streams.get(camera_id)
+    events = stream.subscribe()
+
+    def generate():
+        try:
+            yield from StreamHub.sse(events, closed=lambda: stream.closed)
+        finally:
+            stream.unsubscribe(events)
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/stream/status", methods=["GET"])
+def stream_status():
+    return jsonify({"success": True, "streams": streams.status()}), 200
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Counters and stage latency histograms in the Prometheus text format, labelled with this worker's pid."""
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/backup_status", methods=["GET"])
+def backup_status():
+    return jsonify({"success": True, **backup_scheduler.status()}), 200
+
 # ---------------- KEY MANAGEMENT ----------------
 @app.route("/reset_key", methods=["POST"])
 def reset_key():
+    """Rotate the encryption key online; data files are re-encrypted in the background."""
     try:
-        deleted = delete_key()
-        new_key = generate_key()
-        return jsonify({"success": True, "message": "Key reset successfully"}), 200
+        if not key_rotation.start():
+            return jsonify({"success": False, "error": "Key rotation already running",
+                            "rotation": key_rotation.status()}), 409
+        return jsonify({"success": True, "message": "Key rotation started",
+                        "rotation": key_rotation.status()}), 202
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route("/key_rotation", methods=["GET"])
+def key_rotation_status():
+    return jsonify({"success": True, **key_rotation.status()}), 200
+
 # ---------------- RUN SERVER ----------------
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
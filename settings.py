@@ -21,16 +21,72 @@ class Config:
     twin_match_threshold = 0.28
     process_every_n_frames = 5  # Process every 5th frame for better performance
     display_scale = 0.5  # Smaller scale for better performance
+    display_fps = 30  # GUI redraw rate; capture, recognition and marking run on their own threads
+    
+    # Encrypted backups run in the background; repeated writes within this window share one backup
+    backup_coalesce_seconds = 2.0
+    
+    # Seconds a process waits for another process's register write before giving up
+    writer_lock_timeout = 10.0
+    
+    # Milliseconds between GUI attendance-table updates from register change notifications
+    table_poll_interval_ms = 500
+    
+    # Seconds between metric summaries in the GUI status log
+    metrics_log_interval = 60
+    
+    # On-demand profiling (X-Profile header / ?profile=1, GUI "Profile" button, main.py --profile)
+    profiles_dir = os.path.join(data_dir, 'profiles')
+    profile_sample_interval = 0.005  # Seconds between stack samples
+    profile_max_seconds = 30  # A profile always stops after this long
+    profile_gui_seconds = 10  # Length of a GUI-triggered profile
+    profile_requests = False  # Honor X-Profile / ?profile= on HTTP requests; every profile writes files
+    profile_token = ''  # When set, a request must also send it as X-Profile-Token
+    profile_min_interval = 10  # Seconds between profiled requests (per server process)
     
     # Model files
+    model_dir = ""  # Where the extracted .dat models live; empty means the app directory
+    # Directory (no network access at all) or base URL holding the .dat.bz2 archives; empty means dlib.net.
+    # A directory may also hold plain .dat files and <model>.dat.sha256 checksum files.
+    model_mirror = ""
+    model_sha256 = {  # Expected SHA-256 of each extracted model, by file name (the dlib.net releases)
+        "shape_predictor_68_face_landmarks.dat": "fbdc2cb80eb9aa7a758672cbfdda32ba6300efe9b6e6c7a299ff7e736b11b92f",
+        "dlib_face_recognition_resnet_model_v1.dat": "55533b28a95800a551ba546ba62fe69625c7e95a7061c338adffead08719da30",
+    }
     shape_predictor_url = "http://dlib.net/files/shape_predictor_68_face_landmarks.dat.bz2"
     face_rec_model_url = "http://dlib.net/files/dlib_face_recognition_resnet_model_v1.dat.bz2"
-    shape_predictor_path = "shape_predictor_68_face_landmarks.dat"
-    face_rec_model_path = "dlib_face_recognition_resnet_model_v1.dat"
+    shape_predictor_path = os.path.join(model_dir, "shape_predictor_68_face_landmarks.dat")
+    face_rec_model_path = os.path.join(model_dir, "dlib_face_recognition_resnet_model_v1.dat")
     
     # Server settings
     server_host = "127.0.0.1"
     server_port = 5000
+    server_workers = 0  # Worker processes for serve.py; 0 means one per CPU core
+    attendance_page_size = 1000  # Default/maximum rows per /get_attendance page when paginating
+    max_frames_per_request = 8  # Frames accepted in one /mark_face_attendance batch
+    
+    # Recognition job queue in front of the recognizer
+    recognition_workers = 2  # Threads running recognition jobs; they borrow models from the pool below
+    model_pool_size = 2  # Most model copies one process loads for concurrent recognition (~130 MB each)
+    recognition_queue_depth = 32  # Jobs waiting beyond this are rejected with 429
+    recognition_sync_timeout = 10.0  # Seconds a synchronous request waits before getting a job id
+    recognition_job_ttl = 300  # Seconds finished jobs stay available to GET /recognition_jobs/<id>
+    
+    # HTTP response cache (ETags and compression for read endpoints, see http_cache.py)
+    compress_min_bytes = 1024  # Read responses at least this large are sent gzip/br-compressed
+    
+    # Streaming recognition (/stream/<camera>/frames and /stream/<camera>/events)
+    stream_confirm_frames = 3  # Consecutive matching frames before an identity is confirmed
+    stream_track_iou = 0.3  # Box overlap that continues a track between frames
+    stream_idle_seconds = 60  # Streams with no frames and no listeners are closed after this
+    session_idle_seconds = 300  # Per-camera recognition sessions unused for this long are evicted
+    stream_event_buffer = 256  # Events kept for a slow SSE reader before new ones are dropped
+    stream_max_frame_bytes = 4 * 1024 * 1024  # Largest single frame accepted on a stream upload
+    
+    # Local model server (python model_server.py); without it each app loads its own models
+    model_server_enabled = True  # Use the server when its socket exists
+    model_socket = os.path.join(data_dir, 'model_server.sock')
+    model_server_workers = 2  # Model copies the server keeps for concurrent requests (~130 MB each)
     
     def __init__(self):
         # Create data directory if it doesn't exist
@@ -0,0 +1,209 @@
+"""
+Streaming face recognition for Smart Attendance System.
+
+A camera client keeps one chunked POST open and pushes length-prefixed JPEG
+frames; a second connection reads server-sent events. Each camera has a
+single latest-frame slot: a new frame replaces one that has not been picked
+up yet, so a slow recognizer always works on the newest image and never
+builds a backlog. Face tracks live in the camera's RecognitionSession, and
+results are reported incrementally as events:
+
+- ``track``: a face appeared that does not overlap any face seen just before
+- ``identity``: a track matched the same student on enough consecutive frames
+- ``marked``: attendance was written for that student
+"""
+
+import json
+import time
+import queue
+import struct
+import threading
+import cv2
+import numpy as np
+from settings import config
+from metrics import metrics
+
+FRAME_HEADER = struct.Struct(">I")  # 4-byte big-endian length before every frame
+
+
+class CameraStream:
+    def __init__(self, hub, camera_id):
+        self.hub = hub
+        self.camera_id = camera_id
+        self._slot = None
+        self._cond = threading.Condition()
+        self._subscribers = []
+        self.received = 0
+        self.dropped = 0
+        self.processed = 0
+        self.last_activity = time.monotonic()
+        self.closed = False
+        self._thread = threading.Thread(target=self._run, name=f"stream-{camera_id}", daemon=True)
+        self._thread.start()
+
+    # ---------------- Frames ----------------
+    def push(self, buf):
+        """Offer an encoded frame; an unprocessed older frame is dropped."""
+        with self._cond:
+            if self._slot is not None:
+                self.dropped += 1
+            self._slot = buf
+            self.received += 1
+            self.last_activity = time.monotonic()
+            self._cond.notify()
+
+    def _take(self, timeout):
+        with self._cond:
+            if self._slot is None:
+                self._cond.wait(timeout)
+            buf, self._slot = self._slot, None
+            return buf
+
+    # ---------------- Events ----------------
+    def subscribe(self):
+        q = queue.Queue(maxsize=config.stream_event_buffer)
+        with self._cond:
+            self._subscribers.append(q)
+            self.last_activity = time.monotonic()
+        return q
+
+    def unsubscribe(self, q):
+        with self._cond:
+            if q in self._subscribers:
+                self._subscribers.remove(q)
+            self.last_activity = time.monotonic()
+
+    def emit(self, event_type, **data):
+        event = {"type": event_type, "camera": self.camera_id, "time": time.time(), **data}
+        with self._cond:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                pass  # A reader that stopped draining misses events rather than stalling recognition
+
+    # ---------------- Recognition ----------------
+    def _handle_results(self, results):
+        """Feed results to this camera's session and report what changed."""
+        session = self.hub.face_system.session(self.camera_id)
+        with session.lock:
+            events = session.update_tracks(results)
+        for event in events:
+            kind = event.pop("type")
+            self.emit(kind, **event)
+            if kind == "identity" and self.hub.mark(event["id"], event["name"]):
+                self.emit("marked", track=event["track"], id=event["id"], name=event["name"])
+
+    def _idle(self):
+        with self._cond:
+            return not self._subscribers and time.monotonic() - self.last_activity > config.stream_idle_seconds
+
+    def _run(self):
+        while not self.closed:
+            buf = self._take(timeout=1.0)
+            if buf is None:
+                if self._idle():
+                    self.hub.remove(self.camera_id)
+                continue
+            metrics.inc("upload_bytes_total", len(buf))
+            with metrics.timed("recognition_stage_seconds", stage="decode"):
+                frame = cv2.imdecode(np.frombuffer(buf, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                self.emit("error", error="Could not decode frame")
+                continue
+            try:
+                results = self.hub.recognize(frame)
+            except Exception as e:
+                print(f"[ERROR] Stream {self.camera_id} recognition failed: {e}")
+                continue
+            self.processed += 1
+            self._handle_results(results)
+
+    def close(self):
+        self.closed = True
+        with self._cond:
+            self._cond.notify_all()
+        self.hub.face_system.end_session(self.camera_id)
+        self.emit("closed")
+
+    def status(self):
+        session = self.hub.face_system.sessions.get(self.camera_id)
+        return {"camera": self.camera_id, "received": self.received, "processed": self.processed,
+                "dropped": self.dropped, "tracks": len(session.tracks) if session else 0,
+                "subscribers": len(self._subscribers)}
+
+
+class StreamHub:
+    """All camera streams of one server, sharing the recognizer."""
+
+    def __init__(self, face_system):
+        self.face_system = face_system
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def get(self, camera_id):
+        with self._lock:
+            stream = self._streams.get(camera_id)
+            if stream is None or stream.closed:
+                stream = self._streams[camera_id] = CameraStream(self, camera_id)
+            return stream
+
+    def remove(self, camera_id):
+        with self._lock:
+            stream = self._streams.pop(camera_id, None)
+        if stream:
+            stream.close()
+            print(f"[INFO] Closed idle stream {camera_id}")
+
+    def recognize(self, frame):
+        # Cameras recognize concurrently; each call borrows a copy from the recognizer's model pool
+        return self.face_system.recognize_frames([frame])
+
+    def mark(self, sid, name):
+        """Mark a confirmed student; True if this was a new mark today."""
+        already = sid in self.face_system.attendance_marked
+        self.face_system.mark_attendance(sid, name)
+        return not already and sid in self.face_system.attendance_marked
+
+    def status(self):
+        with self._lock:
+            return [s.status() for s in self._streams.values()]
+
+    # ---------------- Wire Format ----------------
+    @staticmethod
+    def read_frames(stream):
+        """Yield frames from a body of ``<4-byte length><JPEG>`` records as they arrive."""
+        while True:
+            header = stream.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                return
+            (length,) = FRAME_HEADER.unpack(header)
+            if length > config.stream_max_frame_bytes:
+                raise ValueError(f"Frame of {length} bytes exceeds the limit")
+            buf = b""
+            while len(buf) < length:
+                chunk = stream.read(length - len(buf))
+                if not chunk:
+                    return
+                buf += chunk
+            yield buf
+
+    @staticmethod
+    def sse(events, heartbeat=15.0, closed=lambda: False):
+        """Server-sent-events body for a subscriber queue; comments keep idle connections open.
+
+        Ends after the ``closed`` event, or once ``closed()`` is true and the queue
+        has run dry: a full queue drops the ``closed`` event like any other.
+        """
+        while True:
+            try:
+                event = events.get(timeout=heartbeat)
+            except queue.Empty:
+                if closed():
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+            if event["type"] == "closed":
+                return
@@ -0,0 +1,29 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from settings import config
+from crypto_utils import backup_scheduler
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Point every register path (and secret.key) at a fresh temporary directory."""
+    monkeypatch.chdir(tmp_path)
+    data = tmp_path / "data"
+    data.mkdir()
+    monkeypatch.setattr(config, "data_dir", str(data))
+    for name in ("excel_file", "students_file", "yearly_file", "master_file", "calendar_file"):
+        monkeypatch.setattr(config, name, str(data / os.path.basename(getattr(config, name))))
+    yield data
+    backup_scheduler.flush()
+
+
+@pytest.fixture
+def register(data_dir):
+    from attendance import AttendanceRegister
+    reg = AttendanceRegister()
+    yield reg
+    reg.writer.drain()
@@ -0,0 +1,82 @@
+import pandas as pd
+import pytest
+
+from analytics import AttendanceAnalytics, UNASSIGNED
+from partitions import MASTER_COLUMNS
+
+PAST = ["2024-05-06", "2024-05-07", "2024-05-08", "2024-05-09"]
+
+
+@pytest.fixture
+def analytics(register):
+    register.add_students_bulk([(1, "Asha"), (2, "Ben")])
+    statuses = {1: "PPAP", 2: "PPPA"}
+    master = pd.DataFrame([(sid, name, date, statuses[sid][i]) for sid, name in ((1, "Asha"), (2, "Ben"))
+                           for i, date in enumerate(PAST)], columns=MASTER_COLUMNS)
+    register.writer.run(register._write_master, master, PAST[0])
+    return AttendanceAnalytics(register)
+
+
+def test_counters_built_from_history(analytics):
+    assert analytics.student_month(1, "2024-05") == {"present": 3, "days": 4, "percentage": 75.0}
+    assert analytics.section_month(UNASSIGNED, "2024-05") == {"present": 6, "days": 8, "percentage": 75.0}
+    assert analytics.day("2024-05-09") == {"present": 1, "days": 2, "percentage": 50.0}
+    assert analytics.streaks(1) == {"current": 1, "longest": 2}
+    assert analytics.streaks(2) == {"current": 0, "longest": 3}
+
+
+def test_marks_update_counters_incrementally(analytics, register, monkeypatch):
+    analytics.summary()  # build once
+    monkeypatch.setattr(analytics, "rebuild", lambda: pytest.fail("marks should not force a rebuild"))
+    month = register.today_str[:7]
+
+    register.mark_attendance_bulk([(1, "Asha", "P"), (2, "Ben", "A")])
+    assert analytics.day() == {"present": 1, "days": 2, "percentage": 50.0}
+    assert analytics.student_month(1, month) == {"present": 1, "days": 1, "percentage": 100.0}
+    assert analytics.streaks(1) == {"current": 2, "longest": 2}
+
+    # Changing a status today moves the present count without adding a recorded day
+    register.mark_attendance_bulk([(1, "Asha", "A"), (2, "Ben", "P")])
+    assert analytics.day() == {"present": 1, "days": 2, "percentage": 50.0}
+    assert analytics.student_month(1, month) == {"present": 0, "days": 1, "percentage": 0.0}
+    assert analytics.student_month(2, month) == {"present": 1, "days": 1, "percentage": 100.0}
+    assert analytics.streaks(2) == {"current": 1, "longest": 3}
+
+
+def test_new_students_join_the_summary(analytics, register, monkeypatch):
+    analytics.summary()
+    monkeypatch.setattr(analytics, "rebuild", lambda: pytest.fail("new students should not force a rebuild"))
+
+    register.add_students_bulk([(3, "Cara")])
+    register.mark_attendance_bulk([(3, "Cara", "P")])
+
+    summary = analytics.summary()
+    assert summary["total_students"] == 3
+    assert summary["present"] == 1
+    assert summary["sections"] == {UNASSIGNED: {"total": 3, "present": 1, "percentage": 33.33}}
+    assert analytics.student(3)["Name"] == "Cara"
+
+
+def test_month_matrix_is_rebuilt_after_a_mark(analytics, register):
+    matrix = analytics.month_matrix(2024, 5)
+    assert matrix["days"] == [6, 7, 8, 9]
+    assert [s["statuses"] for s in matrix["students"]] == ["PPAP", "PPPA"]
+    assert analytics.month_matrix(2024, 5) is matrix
+
+    year, month = map(int, register.today_str[:7].split("-"))
+    assert analytics.month_matrix(year, month)["students"] == []
+    register.mark_attendance_bulk([(2, "Ben", "P")])
+    today = analytics.month_matrix(year, month)
+    assert today["days"] == [int(register.today_str[8:])]
+    assert [(s["StudentID"], s["statuses"]) for s in today["students"]] == [(2, "P")]
+
+
+def test_foreign_write_forces_a_rebuild(analytics, register):
+    analytics.summary()
+    register.writer._bump_version()  # another process committed a write
+
+    rebuilt = []
+    original = analytics.rebuild
+    analytics.rebuild = lambda: (rebuilt.append(True), original())
+    analytics.summary()
+    assert rebuilt == [True]
@@ -0,0 +1,68 @@
+import pytest
+
+
+def register_files(register):
+    master = register.partitions.master_path(register.partitions.period_of(register.today_str))
+    return [register.excel_file, register.yearly_file, register.calendar_file, master]
+
+
+def read_all(paths):
+    return {p: open(p, "rb").read() for p in paths}
+
+
+def test_add_students_bulk_skips_duplicates(register):
+    result = register.add_students_bulk([(1, "Asha"), {"StudentID": 2, "Name": "Ben"}, (1, "Asha again")])
+    assert result == {"added": [1, 2], "skipped": [1]}
+
+    result = register.add_students_bulk([(2, "Ben"), (3, "Cara")])
+    assert result == {"added": [3], "skipped": [2]}
+    assert register.load_daily()["StudentID"].tolist() == [1, 2, 3]
+
+
+def test_mark_bulk_applies_all_records(register):
+    register.add_students_bulk([(1, "Asha"), (2, "Ben")])
+    result = register.mark_attendance_bulk([(1, "Asha", "P"), {"StudentID": "2", "Name": "Ben", "Status": "a"}])
+
+    assert result["success"]
+    assert [(r["StudentID"], r["Status"], r["applied"]) for r in result["results"]] == [(1, "P", True), (2, "A", True)]
+    assert register.statuses_today() == {1: "P", 2: "A"}
+    master = register.load_master(register.today_str, register.today_str)
+    assert dict(zip(master["StudentID"], master["Status"])) == {1: "P", 2: "A"}
+
+
+def test_mark_bulk_rejects_invalid_records_without_writing(register):
+    register.add_students_bulk([(1, "Asha")])
+    before = read_all(register_files(register))
+
+    result = register.mark_attendance_bulk([(1, "Asha", "P"), ("x", "Bad", "P"), (2, "Ben", "L"), "junk"])
+
+    assert not result["success"]
+    errors = [r.get("error") for r in result["results"]]
+    assert errors[0] is None
+    assert errors[1].startswith("invalid StudentID")
+    assert errors[2].startswith("invalid status")
+    assert errors[3] == "malformed record"
+    assert not any(r.get("applied") for r in result["results"])
+    assert read_all(register_files(register)) == before
+
+
+def test_mark_bulk_restores_registers_when_a_write_fails(register, monkeypatch):
+    register.add_students_bulk([(1, "Asha"), (2, "Ben")])
+    before = read_all(register_files(register))
+
+    original = type(register)._replace_bytes
+    writes = []
+
+    def failing_replace(path, data):
+        writes.append(path)
+        if len(writes) == 3:
+            raise OSError("disk full")
+        original(path, data)
+
+    monkeypatch.setattr(type(register), "_replace_bytes", staticmethod(failing_replace))
+    with pytest.raises(OSError):
+        register.mark_attendance_bulk([(1, "Asha", "P"), (2, "Ben", "P")])
+    monkeypatch.setattr(type(register), "_replace_bytes", staticmethod(original))
+
+    assert read_all(register_files(register)) == before
+    assert register.statuses_today() == {1: "A", 2: "A"}
@@ -0,0 +1,70 @@
+import pandas as pd
+import pytest
+
+from partitions import MASTER_COLUMNS
+
+DATES = ["2024-11-29", "2024-12-02", "2024-12-31", "2025-01-02", "2025-01-03", "2025-02-10"]
+
+
+@pytest.fixture
+def history(register):
+    """Three students on each of DATES, spread over four month partitions of two years."""
+    rows = [(sid, f"Student {sid}", date, "P" if (sid + i) % 2 else "A")
+            for i, date in enumerate(DATES) for sid in (3, 1, 2)]
+    master = pd.DataFrame(rows, columns=MASTER_COLUMNS)
+
+    def write_partitions():
+        for period, part in master.groupby(master["Date"].str[:7]):
+            register._write_master(part.reset_index(drop=True), f"{period}-01")
+
+    register.writer.run(write_partitions)
+    return master
+
+
+def collect_pages(register, limit, **filters):
+    keys, cursor, pages = [], None, 0
+    while True:
+        df, cursor = register.page_master(cursor=cursor, limit=limit, **filters)
+        keys.extend(zip(df["Date"], df["StudentID"]))
+        pages += 1
+        if cursor is None:
+            return keys, pages
+
+
+def expected_keys(master, start=None, end=None, student_id=None):
+    df = master
+    if start:
+        df = df[df["Date"] >= start]
+    if end:
+        df = df[df["Date"] <= end]
+    if student_id is not None:
+        df = df[df["StudentID"] == student_id]
+    df = df.sort_values(["Date", "StudentID"], ascending=[False, True])
+    return list(zip(df["Date"], df["StudentID"]))
+
+
+@pytest.mark.parametrize("limit", [1, 2, 4, 5, 18, 50])
+def test_pages_cover_every_row_once_newest_first(register, history, limit):
+    keys, pages = collect_pages(register, limit, end="2025-12-31")
+    assert keys == expected_keys(history)
+    assert pages == max(1, -(-len(history) // limit))
+
+
+def test_pages_respect_date_range_and_student(register, history):
+    keys, _ = collect_pages(register, 2, start="2024-12-01", end="2025-01-02")
+    assert keys == expected_keys(history, "2024-12-01", "2025-01-02")
+
+    keys, _ = collect_pages(register, 2, student_id=2, end="2025-12-31")
+    assert keys == expected_keys(history, student_id=2)
+
+
+def test_unpaged_query_returns_rows_oldest_first(register, history):
+    df, cursor = register.page_master(start="2024-12-01", end="2025-01-31")
+    assert cursor is None
+    assert list(zip(df["Date"], df["StudentID"])) == sorted(expected_keys(history, "2024-12-01", "2025-01-31"))
+
+
+def test_cursor_round_trip():
+    from attendance import AttendanceRegister
+    cursor = AttendanceRegister.encode_cursor("2025-01-03", 42)
+    assert AttendanceRegister.decode_cursor(cursor) == ("2025-01-03", 42)
@@ -0,0 +1,80 @@
+import os
+import stat
+import pandas as pd
+import pytest
+
+from partitions import PartitionStore, MASTER_COLUMNS
+
+
+def write_table(df, path):
+    df.to_excel(path, index=False)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PartitionStore(str(tmp_path), pd.read_excel)
+
+
+@pytest.fixture
+def legacy_master(tmp_path):
+    path = tmp_path / "attendance_master.xlsx"
+    rows = [(1, "Asha", "2024-03-04", "P"), (2, "Ben", "2024-03-04", "A"),
+            (1, "Asha", "2024-04-01", "A"), (1, "Asha", "2025-01-06", "P")]
+    write_table(pd.DataFrame(rows, columns=MASTER_COLUMNS), path)
+    return str(path)
+
+
+def test_migrate_legacy_master_splits_by_month(store, legacy_master):
+    store.migrate_legacy_master(legacy_master, write_table)
+
+    assert sorted(e["period"] for e in store.entries("master")) == ["2024-03", "2024-04", "2025-01"]
+    assert store.catalog["partitions"]["master/2024-03"]["rows"] == 2
+    assert not os.path.exists(legacy_master)
+    assert os.path.exists(f"{legacy_master}.migrated")
+    assert len(store.query_master()) == 4
+    assert store.query_master("2024-04-01", "2024-12-31")["Date"].tolist() == ["2024-04-01"]
+
+
+def test_migrate_legacy_master_runs_once(store, legacy_master, tmp_path):
+    store.migrate_legacy_master(legacy_master, write_table)
+    os.replace(f"{legacy_master}.migrated", legacy_master)
+
+    store.migrate_legacy_master(legacy_master, write_table)
+
+    assert os.path.exists(legacy_master)
+    assert len(store.query_master()) == 4
+    assert "master" in PartitionStore(str(tmp_path), pd.read_excel).catalog["migrated"]
+
+
+def test_compact_closed_years(store, legacy_master):
+    store.migrate_legacy_master(legacy_master, write_table)
+    compacted = []
+
+    store.compact_closed_years(2025, on_compacted=compacted.append)
+
+    out = store.compacted_path("master", "2024")
+    assert compacted == [out]
+    assert not os.stat(out).st_mode & stat.S_IWUSR
+    assert not os.path.exists(store.master_path("2024-03"))
+    assert store.is_read_only("master", "2024-03") and store.is_read_only("master", "2024-04")
+    assert not store.is_read_only("master", "2025-01")
+    assert store.read_master_partition("2024-03")["StudentID"].tolist() == [1, 2]
+    assert store.query_master(end="2024-12-31")["Date"].tolist() == ["2024-03-04", "2024-03-04", "2024-04-01"]
+    assert store.master_periods() == ["2025-01", "2024-04", "2024-03"]
+
+
+def test_compaction_merges_into_an_existing_year(store, legacy_master):
+    store.migrate_legacy_master(legacy_master, write_table)
+    store.compact_closed_years(2025)
+
+    # A late partition of an already compacted year is folded into the same file
+    late = pd.DataFrame([(3, "Cara", "2024-12-20", "P")], columns=MASTER_COLUMNS)
+    path = store.master_path("2024-12")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_table(late, path)
+    store.record("master", "2024-12", path, 1)
+    store.compact_closed_years(2025)
+
+    assert store.is_read_only("master", "2024-12")
+    assert store.query_master(end="2024-12-31")["StudentID"].tolist() == [1, 2, 1, 3]
+    assert len(store.query_master()) == 5
@@ -1,28 +1,95 @@
 import os
 import bz2
+import hashlib
+import tempfile
 import urllib.request
-from pathlib import Path
+from urllib.parse import urlparse
+from settings import config
+
+CHUNK_SIZE = 1024 * 1024  # Bytes read and decompressed per step; bounds memory whatever the model size
+
+
+def _open_source(url, output_path):
+    """Return ``(name, stream)`` for a model: a leftover archive, the configured mirror, then the network."""
+    archive = os.path.basename(urlparse(url).path)
+    candidates = [output_path + '.bz2']  # Left behind by an earlier version or an interrupted run
+    mirror = config.model_mirror
+    remote = mirror.startswith(("http://", "https://"))
+    if mirror and not remote:
+        candidates += [os.path.join(mirror, archive), os.path.join(mirror, os.path.basename(output_path))]
+    for path in candidates:
+        if os.path.exists(path):
+            return path, open(path, 'rb')
+    if mirror and not remote:
+        # A local mirror means this machine must not go to the network
+        raise FileNotFoundError(f'{archive} is not in the model mirror {mirror}')
+    if remote:
+        url = mirror.rstrip('/') + '/' + archive
+    print(f'[INFO] Downloading: {url}')
+    return url, urllib.request.urlopen(url, timeout=60)
+
+
+def _expected_sha256(output_path):
+    """Digest the extracted model must have: from settings, else a ``<model>.sha256`` file in a local mirror."""
+    name = os.path.basename(output_path)
+    expected = config.model_sha256.get(name)
+    mirror = config.model_mirror
+    if not expected and mirror and not mirror.startswith(("http://", "https://")):
+        sidecar = os.path.join(mirror, name + '.sha256')
+        if os.path.exists(sidecar):
+            with open(sidecar, encoding='utf-8') as f:
+                expected = f.read().split()[0]
+    return expected.lower() if expected else None
+
 
 def download_and_extract(url, output_path):
-    """Download and extract model files if they don't exist."""
+    """Download and extract model files if they don't exist.
+
+    The archive is decompressed in fixed-size chunks into a temporary file
+    beside ``output_path``, hashed on the way, and renamed into place only when
+    it is complete and its SHA-256 matches, so a failed run never leaves a
+    model that looks present. Returns True when the model is available.
+    """
     if os.path.exists(output_path):
-        return
-    
-    bz2_path = output_path + '.bz2'
-    if not os.path.exists(bz2_path):
-        print(f'[INFO] Downloading: {url}')
-        try:
-            urllib.request.urlretrieve(url, bz2_path)
-        except Exception as e:
-            print(f'[ERROR] Failed to download {url}: {e}')
-            return
-    
-    print(f'[INFO] Extracting {bz2_path}')
+        return True
+    target_dir = os.path.dirname(output_path) or '.'
+    os.makedirs(target_dir, exist_ok=True)
     try:
-        with bz2.BZ2File(bz2_path, 'rb') as f_in:
-            with open(output_path, 'wb') as f_out:
-                f_out.write(f_in.read())
-        # Clean up compressed file
-        os.remove(bz2_path)
+        source, stream = _open_source(url, output_path)
     except Exception as e:
-        print(f'[ERROR] Failed to extract {bz2_path}: {e}')
+        print(f'[ERROR] Failed to download {url}: {e}')
+        return False
+
+    expected = _expected_sha256(output_path)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(output_path) + '.', suffix='.part', dir=target_dir)
+    print(f'[INFO] Extracting {source}')
+    try:
+        with stream, os.fdopen(fd, 'wb') as f_out:
+            f_in = bz2.BZ2File(stream) if urlparse(source).path.endswith('.bz2') else stream
+            while True:
+                chunk = f_in.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                f_out.write(chunk)
+            f_out.flush()
+            os.fsync(f_out.fileno())
+        actual = digest.hexdigest()
+        if expected and actual != expected:
+            raise ValueError(f'SHA-256 mismatch: expected {expected}, got {actual}')
+        os.replace(tmp_path, output_path)
+    except Exception as e:
+        print(f'[ERROR] Failed to extract {source}: {e}')
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if source == output_path + '.bz2' and os.path.exists(source):
+            # A truncated or corrupt leftover would be picked again on every run; fetch afresh next time
+            os.remove(source)
+            print(f'[INFO] Removed bad archive {source}')
+        return False
+
+    if source == output_path + '.bz2':
+        os.remove(source)  # Clean up compressed file
+    print(f'[INFO] Installed {output_path} (sha256 {actual}{", verified" if expected else ""})')
+    return True